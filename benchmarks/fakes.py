@@ -0,0 +1,255 @@
+# Local stand-ins for yt-dlp, spotipy and discord's voice connection, so the bot's hot paths can be timed without
+# the network. Payloads have the shape the bot reads from the real ones and every id is derived from the request,
+# so different requests never hit each other's cache entries.
+import re
+import threading
+import time
+import types
+from typing import Optional
+
+YOUTUBE_ID_PATTERN = re.compile(r"(?:v=|youtu\.be/)([\w-]{11})")
+PLAYLIST_ID_PATTERN = re.compile(r"list=([\w-]+)")
+SEARCH_PATTERN = re.compile(r"^ytsearch(\d*):(.*)$", re.DOTALL)
+
+
+class FakeExtractorSettings:
+    latency = 0.0  # seconds each extract_info call sleeps, like a request to youtube would
+    playlistSize = 200
+    playlistPageSize = 100  # playlists sleep `latency` for every page listed up to the last requested entry
+    unavailableEvery = 97  # every nth playlist entry has no duration, like a private video
+
+
+def makeVideoInfo(videoId: str) -> dict:
+    return {
+        "id": videoId,
+        "url": f"https://rr1---sn-fake.googlevideo.com/videoplayback?expire={int(time.time()) + 6 * 3600}&id={videoId}",
+        "webpage_url": f"https://www.youtube.com/watch?v={videoId}",
+        "title": f"Video {videoId}",
+        "duration": 180 + sum(map(ord, videoId)) % 240,
+        "uploader": f"Channel {videoId[:3]}",
+        "acodec": "opus",
+        "abr": 129.5,
+        "ext": "webm",
+        "thumbnail": f"https://i.ytimg.com/vi/{videoId}/hqdefault.jpg",
+        "thumbnails": [{"url": f"https://i.ytimg.com/vi/{videoId}/hqdefault.jpg"}],
+        "formats": [{"format_id": str(i), "url": "https://example.invalid/format"} for i in range(20)]
+    }
+
+
+def makePlaylistEntry(videoId: str, index: int) -> dict:
+    info = makeVideoInfo(videoId)
+    unavailable = index % FakeExtractorSettings.unavailableEvery == 0
+    return {
+        "id": videoId, "url": info["webpage_url"], "title": "[Private video]" if unavailable else info["title"],
+        "duration": None if unavailable else info["duration"], "uploader": info["uploader"],
+        "thumbnails": info["thumbnails"], "playlist_index": index
+    }
+
+
+class FakeYoutubeDL:
+    # answers extract_info for videos, playlists and ytsearchN: queries
+    def __init__(self, options: Optional[dict] = None):
+        self.params = dict(options or {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def getPlaylistRange(self) -> tuple[int, int]:
+        size = FakeExtractorSettings.playlistSize
+        items = self.params.get("playlist_items", None)
+        if not items:
+            return 1, size
+        first, _, last = items.partition("-")
+        return int(first or 1), min(int(last or size), size)
+
+    def extract_info(self, url: str, download: bool = False) -> dict:
+        if (playlistMatch := PLAYLIST_ID_PATTERN.search(url)) is not None:
+            first, last = self.getPlaylistRange()
+            pages = max(1, -(-last // FakeExtractorSettings.playlistPageSize))
+            if FakeExtractorSettings.latency > 0:
+                time.sleep(FakeExtractorSettings.latency * pages)
+            key = playlistMatch.group(1)[-6:].rjust(6, "0")
+            return {
+                "id": playlistMatch.group(1), "playlist_count": FakeExtractorSettings.playlistSize,
+                "entries": [makePlaylistEntry(f"{key}{i:05d}", i) for i in range(first, last + 1)]
+            }
+        if FakeExtractorSettings.latency > 0:
+            time.sleep(FakeExtractorSettings.latency)
+        if (searchMatch := SEARCH_PATTERN.match(url)) is not None:
+            count = int(searchMatch.group(1) or 1)
+            key = f"{abs(hash(searchMatch.group(2))):011d}"[:9]
+            return {"entries": [makeVideoInfo(f"{key}{i:02d}") for i in range(count)]}
+        if (videoMatch := YOUTUBE_ID_PATTERN.search(url)) is not None:
+            return makeVideoInfo(videoMatch.group(1))
+        return None
+
+
+fakeYtDlp = types.SimpleNamespace(YoutubeDL=FakeYoutubeDL)
+
+
+class FakeSpotify:
+    # the spotipy.Spotify calls the bot makes, albums and playlists are paged like the web api does
+    PAGE_SIZE = 100
+
+    def __init__(self, latency: float = 0.0, collectionSize: int = 250):
+        self.latency = latency
+        self.collectionSize = collectionSize
+
+    def wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def makeTrack(trackId: str) -> dict:
+        return {
+            "id": trackId, "name": f"Track {trackId}", "duration_ms": 200000 + sum(map(ord, trackId)) * 10,
+            "artists": [{"name": f"Artist {trackId[:4]}"}],
+            "album": {"name": f"Album {trackId[:6]}", "images": [{"url": f"https://i.scdn.co/image/{trackId[:6]}"}]}
+        }
+
+    def makePage(self, collectionId: str, offset: int, wrap: bool) -> dict:
+        ids = [f"{collectionId[:12]}{i:010d}" for i in range(offset, min(offset + self.PAGE_SIZE, self.collectionSize))]
+        nextOffset = offset + self.PAGE_SIZE
+        return {
+            "items": [{"track": self.makeTrack(trackId)} if wrap else self.makeTrack(trackId) for trackId in ids],
+            "next": f"{collectionId}:{nextOffset}:{int(wrap)}" if nextOffset < self.collectionSize else None
+        }
+
+    def track(self, track_id: str) -> dict:
+        self.wait()
+        return self.makeTrack(track_id)
+
+    def album(self, album_id: str) -> dict:
+        self.wait()
+        return {"name": f"Album {album_id}", "images": [{"url": f"https://i.scdn.co/image/{album_id}"}],
+                "tracks": self.makePage(album_id, 0, False)}
+
+    def playlist(self, playlist_id: str) -> dict:
+        self.wait()
+        return {"name": f"Playlist {playlist_id}", "images": [{"url": f"https://i.scdn.co/image/{playlist_id}"}],
+                "tracks": self.makePage(playlist_id, 0, True)}
+
+    def artist(self, artist_id: str) -> dict:
+        self.wait()
+        return {"images": [{"url": f"https://i.scdn.co/image/{artist_id}"}]}
+
+    def artist_top_tracks(self, artist_id: str) -> dict:
+        self.wait()
+        return {"tracks": [self.makeTrack(f"{artist_id[:12]}{i:010d}") for i in range(10)]}
+
+    def next(self, page: dict) -> Optional[dict]:
+        if page.get("next", None) is None:
+            return None
+        self.wait()
+        collectionId, offset, wrap = page["next"].split(":")
+        return self.makePage(collectionId, int(offset), wrap == "1")
+
+
+class FakeAudioSource:
+    def __init__(self, stream: dict):
+        self.stream = stream
+
+    def cleanup(self):
+        pass
+
+
+class FakeVoiceClient:
+    # plays each source for `trackLength` seconds and then calls `after` from another thread, like the audio
+    # player thread does when a song ends
+    def __init__(self, trackLength: float = 0.0, guild: Optional["FakeGuild"] = None):
+        self.trackLength = trackLength
+        self.guild = guild
+        self.connected = True
+        self.playing = False
+        self.paused = False
+        self.after = None
+        self.plays = 0
+        self.timer: Optional[threading.Timer] = None
+        self.channel = None
+
+    def is_connected(self):
+        return self.connected
+
+    def is_playing(self):
+        return self.playing
+
+    def is_paused(self):
+        return self.paused
+
+    def play(self, source, after=None, **kwargs):
+        if self.playing:
+            raise RuntimeError("Already playing audio.")
+        self.playing = True
+        self.after = after
+        self.plays += 1
+        self.timer = threading.Timer(self.trackLength, self.finish)
+        self.timer.start()
+
+    def finish(self, error: Optional[Exception] = None):
+        if not self.playing:
+            return
+        self.playing = False
+        after, self.after = self.after, None
+        if after is not None:
+            after(error)
+
+    def stop(self):
+        self.paused = False
+        if self.timer is not None:
+            self.timer.cancel()
+        self.finish()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    async def disconnect(self, force: bool = False):
+        self.stop()
+        self.connected = False
+        if self.guild is not None:
+            self.guild.voice_client = None
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeTextChannel"):
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        self.channel.calls += 1
+
+    async def delete(self):
+        self.channel.calls += 1
+
+
+class FakeTextChannel:
+    id = 1
+
+    def __init__(self):
+        self.calls = 0
+
+    async def send(self, *args, **kwargs):
+        self.calls += 1
+        return FakeMessage(self)
+
+
+class FakeGuild:
+    def __init__(self, guildId: int, trackLength: float = 0.0):
+        self.id = guildId
+        self.voice_client = FakeVoiceClient(trackLength, self)
+
+    def get_channel(self, channelId: int):
+        return None
+
+
+class FakeUser:
+    id = 356482115161948171
+
+
+class FakeBotMain:
+    def __init__(self, path: str):
+        self.path = path
@@ -0,0 +1,129 @@
+# Memory a synthetic big guild takes in nextcord's cache with Intents.all() against the lean gateway mode of
+# BotMain, plus the cost of finding a user's voice channel by scanning channels against reading their voice state.
+# The guild is fed straight to the connection state the way a GUILD_CREATE event would, no connection is made.
+# run from the repository root with: python -m benchmarks.gateway_memory [--members 50000]
+import argparse
+import asyncio
+import gc
+import json
+import timeit
+import tracemalloc
+import types
+
+import nextcord
+from nextcord.state import ConnectionState
+
+from cogs.music_cog import MusicCog, UserNotInVoiceChannel
+
+GUILD_ID = 900000000000000000
+VOICE_CHANNELS = 25
+TEXT_CHANNELS = 50
+
+
+def makeUser(i: int) -> dict:
+    return {"id": str(100000000000000000 + i), "username": f"member{i}", "discriminator": "0", "avatar": None}
+
+
+def makeMember(i: int) -> dict:
+    return {"user": makeUser(i), "roles": [], "joined_at": "2021-01-01T00:00:00+00:00", "deaf": False,
+            "mute": False, "nick": None}
+
+
+def makeGuildPayload(members: int, inVoice: int, online: float) -> dict:
+    channels = [
+        {"id": str(GUILD_ID + 1 + i), "type": 2, "name": f"voice {i}", "position": i, "permission_overwrites": [],
+         "bitrate": 64000, "user_limit": 0}
+        for i in range(VOICE_CHANNELS)
+    ] + [
+        {"id": str(GUILD_ID + 1000 + i), "type": 0, "name": f"text-{i}", "position": i, "permission_overwrites": []}
+        for i in range(TEXT_CHANNELS)
+    ]
+    return {
+        "id": str(GUILD_ID), "name": "synthetic", "owner_id": makeUser(0)["id"], "member_count": members,
+        "roles": [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "color": 0, "hoist": False,
+                   "position": 0, "managed": False, "mentionable": False}],
+        "channels": channels,
+        "members": [makeMember(i) for i in range(members)],
+        "presences": [
+            {"user": {"id": makeUser(i)["id"]}, "status": "online", "client_status": {"desktop": "online"},
+             "activities": [{"name": "a game", "type": 0}]}
+            for i in range(int(members * online))
+        ],
+        "voice_states": [
+            {"user_id": makeUser(i)["id"], "channel_id": channels[i % VOICE_CHANNELS]["id"], "session_id": f"s{i}",
+             "deaf": False, "mute": False, "self_deaf": False, "self_mute": False, "self_video": False,
+             "suppress": False, "request_to_speak_timestamp": None, "member": makeMember(i)}
+            for i in range(inVoice)
+        ]
+    }
+
+
+def makeState(lean: bool, loop) -> ConnectionState:
+    if lean:
+        intents = nextcord.Intents.none()
+        intents.guilds = True
+        intents.voice_states = True
+        options = {"member_cache_flags": nextcord.MemberCacheFlags.from_intents(intents)}
+    else:
+        intents = nextcord.Intents.all()
+        options = {}
+    return ConnectionState(dispatch=lambda *args, **kwargs: None, handlers={}, hooks={}, http=None, loop=loop,
+                           intents=intents, chunk_guilds_at_startup=False, **options)
+
+
+def legacyGetUserVc(inter):
+    for vc in inter.guild.voice_channels:
+        if inter.user in vc.members:
+            return vc
+    raise UserNotInVoiceChannel
+
+
+def run(lean: bool, args, loop) -> dict:
+    payload = makeGuildPayload(args.members, args.in_voice, args.online)
+    gc.collect()
+    tracemalloc.start()
+    state = makeState(lean, loop)
+    guild = state._add_guild_from_data(payload)
+    del payload
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # interactions carry their own member object, built from the payload like this
+    lastInVoice = args.in_voice - 1  # in the last voice channel, the worst case for a scan
+    user = nextcord.Member(data=makeMember(lastInVoice), guild=guild, state=state)
+    inter = types.SimpleNamespace(guild=guild, user=user)
+    channel = MusicCog.getUserVc(inter)
+    try:
+        legacyFindsUser = legacyGetUserVc(inter) == channel
+    except UserNotInVoiceChannel:
+        legacyFindsUser = False  # members outside the cache aren't in vc.members
+    return {
+        "cachedMembers": len(guild.members),
+        "retainedBytes": retained,
+        "legacyFindsUser": legacyFindsUser,
+        "legacyLookupSeconds": timeit.timeit(lambda: legacyGetUserVc(inter), number=1000) / 1000
+        if legacyFindsUser else None,
+        "voiceStateLookupSeconds": timeit.timeit(lambda: MusicCog.getUserVc(inter), number=1000) / 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=50000)
+    parser.add_argument("--in-voice", type=int, default=200)
+    parser.add_argument("--online", type=float, default=0.3, help="fraction of members with a presence")
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    results = {"members": args.members, "inVoice": args.in_voice}
+    for mode in ("all", "lean"):
+        results[mode] = run(mode == "lean", args, loop)
+    results["memoryRatio"] = round(results["all"]["retainedBytes"] / results["lean"]["retainedBytes"], 2)
+    loop.close()
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
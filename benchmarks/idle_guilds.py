@@ -0,0 +1,79 @@
+# Memory kept by guilds that used the bot once and went quiet, with their contexts in memory against after the
+# inactivity manager disconnected and hibernated them, plus how long a hibernated guild takes to come back.
+# Runs on the stand-ins in benchmarks/fakes.py, without persistence so hibernated state stays in memory.
+# run from the repository root with: python -m benchmarks.idle_guilds [--guilds 500]
+import argparse
+import asyncio
+import gc
+import json
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fakes import FakeGuild, FakeUser
+from benchmarks.suite import makeCog, makeGuildContext
+from cogs.music_cog import YoutubeAudioNode
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as path:
+        cog = makeCog(path)
+        try:
+            gc.collect()
+            tracemalloc.start()
+            guilds = []
+            for guildId in range(1000, 1000 + args.guilds):
+                guildContext = makeGuildContext(cog, guildId, trackLength=600)
+                guilds.append(guildContext.guild)
+                await guildContext.commandHandler.enqueue([
+                    YoutubeAudioNode(f"https://youtu.be/i{guildId:05d}{i:05d}", FakeUser.id, 200, f"Song {i}",
+                                     "Uploader", None)
+                    for i in range(args.queued)
+                ])
+                await guildContext.wakeUp()
+                await guildContext.pause()  # left paused, like most guilds that stop listening
+            await asyncio.sleep(0.1)
+            gc.collect()
+            idleBytes, _ = tracemalloc.get_traced_memory()
+
+            cog.inactivity.disconnectAfter = cog.inactivity.hibernateAfter = 0
+            await cog.inactivity.check()  # leaves voice
+            await asyncio.sleep(0.1)
+            await cog.inactivity.check()  # hibernates
+            await asyncio.sleep(0.1)
+            gc.collect()
+            hibernatedBytes, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            for guild in guilds[:100]:
+                cog.getGuildContext(FakeGuild(guild.id))
+            wakeSeconds = (time.perf_counter() - start) / min(100, len(guilds))
+            woken = cog.guildContexts[guilds[0].id]
+            return {
+                "guilds": args.guilds,
+                "queuedPerGuild": args.queued,
+                "idleBytesPerGuild": round(idleBytes / args.guilds),
+                "hibernatedBytesPerGuild": round(hibernatedBytes / args.guilds),
+                "hibernated": cog.inactivity.hibernations,
+                "wakeSeconds": round(wakeSeconds, 6),
+                "queueAfterWake": len(woken.queue)
+            }
+        finally:
+            for guildContext in cog.guildContexts.values():
+                guildContext.close()
+            cog.cog_unload()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=500)
+    parser.add_argument("--queued", type=int, default=20, help="songs left in each guild's queue")
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
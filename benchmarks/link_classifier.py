@@ -0,0 +1,99 @@
+# Checks classifyRequest against a corpus of /play inputs, then times it.
+# run from the repository root with: python -m benchmarks.link_classifier
+import json
+import sys
+import timeit
+
+from lib.link_classifier import LinkInfo, MediaType, Provider, classifyRequest
+
+V = "dQw4w9WgXcQ"
+PL = "PLFgquLnL59alCl_2TQvOiD5Vgm1hCaGSI"
+SP = "4uLU6hMCjMI75M1A2tKUQC"
+
+CORPUS = [
+    # youtube videos
+    (f"https://www.youtube.com/watch?v={V}", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"http://youtube.com/watch?v={V}&t=42s", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"youtube.com/watch?feature=share&v={V}", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://m.youtube.com/watch?v={V}", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://music.youtube.com/watch?v={V}&si=abc", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://youtu.be/{V}", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://youtu.be/{V}?si=__Pql104Xd-6aKKd", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"youtu.be/{V}?t=10", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://www.youtube.com/shorts/{V}", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://youtube.com/shorts/{V}?feature=share", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://www.youtube.com/live/{V}", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://www.youtube.com/embed/{V}?rel=0", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://www.youtube-nocookie.com/embed/{V}", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://www.youtube.com/v/{V}?version=3", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://www.youtube.com/attribution_link?a=x&u=/watch%3Fv%3D{V}%26feature%3Dshare",
+     LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://www.youtube.com/oembed?url=http%3A//www.youtube.com/watch?v%3D{V}&format=json",
+     LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"<https://youtu.be/{V}>", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"  https://youtu.be/{V}  ", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    (f"https://www.youtube.com/watch?v={V}&list={PL}&index=3", LinkInfo(Provider.Youtube, MediaType.Video, V)),
+    # youtube playlists
+    (f"https://www.youtube.com/playlist?list={PL}", LinkInfo(Provider.Youtube, MediaType.Playlist, PL)),
+    (f"https://youtube.com/playlist?list={PL}&si=xyz", LinkInfo(Provider.Youtube, MediaType.Playlist, PL)),
+    (f"https://music.youtube.com/playlist?list={PL}", LinkInfo(Provider.Youtube, MediaType.Playlist, PL)),
+    (f"https://www.youtube.com/playlist?list={PL}&index=12", LinkInfo(Provider.Youtube, MediaType.Playlist, PL, 12)),
+    (f"https://www.youtube.com/watch?list={PL}&index=4", LinkInfo(Provider.Youtube, MediaType.Playlist, PL, 4)),
+    # spotify
+    (f"https://open.spotify.com/track/{SP}", LinkInfo(Provider.Spotify, MediaType.Song, SP)),
+    (f"https://open.spotify.com/track/{SP}?si=428c2591ce7b4a83", LinkInfo(Provider.Spotify, MediaType.Song, SP)),
+    (f"open.spotify.com/album/{SP}", LinkInfo(Provider.Spotify, MediaType.Album, SP)),
+    (f"https://open.spotify.com/playlist/{SP}?si=abc&pt=def", LinkInfo(Provider.Spotify, MediaType.Playlist, SP)),
+    (f"https://open.spotify.com/artist/{SP}", LinkInfo(Provider.Spotify, MediaType.Artist, SP)),
+    (f"https://open.spotify.com/intl-pt/track/{SP}?si=1", LinkInfo(Provider.Spotify, MediaType.Song, SP)),
+    (f"https://open.spotify.com/intl-es-419/album/{SP}", LinkInfo(Provider.Spotify, MediaType.Album, SP)),
+    (f"https://open.spotify.com/embed/track/{SP}", LinkInfo(Provider.Spotify, MediaType.Song, SP)),
+    (f"https://open.spotify.com/episode/{SP}", LinkInfo(Provider.Spotify, MediaType.Episode, SP)),
+    (f"spotify:track:{SP}", LinkInfo(Provider.Spotify, MediaType.Song, SP)),
+    # searches
+    ("never gonna give you up", LinkInfo(Provider.Search, None, "never gonna give you up")),
+    ("AC/DC - Back In Black", LinkInfo(Provider.Search, None, "AC/DC - Back In Black")),
+    ("Mr. Brightside", LinkInfo(Provider.Search, None, "Mr. Brightside")),
+    ("youtube rewind 2018", LinkInfo(Provider.Search, None, "youtube rewind 2018")),
+    ("Mr.Brightside", LinkInfo(Provider.Search, None, "Mr.Brightside")),
+    ("Dr.Dre - Still D.R.E.", LinkInfo(Provider.Search, None, "Dr.Dre - Still D.R.E.")),
+    ("will.i.am", LinkInfo(Provider.Search, None, "will.i.am")),
+    ("feat.Drake", LinkInfo(Provider.Search, None, "feat.Drake")),
+    # links that can't be played
+    ("https://example.com/song.mp3", LinkInfo(Provider.Unknown, None, None)),
+    ("https://www.youtube.com/@RickAstleyYT", LinkInfo(Provider.Unknown, None, None)),
+    ("https://www.youtube.com/watch?v=short", LinkInfo(Provider.Unknown, None, None)),
+    ("https://open.spotify.com/user/spotify", LinkInfo(Provider.Unknown, None, None)),
+    ("https://open.spotify.com/track/tooShort", LinkInfo(Provider.Unknown, None, None)),
+    ("", LinkInfo(Provider.Unknown, None, None)),
+    ("http://[::1", LinkInfo(Provider.Unknown, None, None)),
+    (f"https://www.youtube.com/playlist?list={PL}&index={'9' * 5000}", LinkInfo(Provider.Unknown, None, None)),
+]
+
+
+def checkCorpus() -> int:
+    failures = 0
+    for request, expected in CORPUS:
+        if (result := classifyRequest(request)) != expected:
+            failures += 1
+            print(f"MISMATCH {request!r}\n  expected {expected}\n  got      {result}")
+    return failures
+
+
+def main():
+    failures = checkCorpus()
+    number = 20000
+    seconds = timeit.timeit(lambda: [classifyRequest(request) for request, _ in CORPUS], number=number // 10)
+    results = {
+        "corpusSize": len(CORPUS),
+        "failures": failures,
+        "microsecondsPerRequest": round(seconds / (number // 10 * len(CORPUS)) * 1e6, 3)
+    }
+    print(json.dumps(results, indent=2))
+    if failures:
+        sys.exit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
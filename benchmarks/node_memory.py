@@ -0,0 +1,105 @@
+# Bytes per queued node, old layout vs the slotted nodes.
+# run from the repository root with: python -m benchmarks.node_memory
+import gc
+import json
+import tracemalloc
+
+from cogs.music_cog import SpotifyAudioNode, YoutubeAudioNode
+
+TRACKS = 5000
+ALBUM_SIZE = 12
+
+
+class LegacyAudioNode:
+    # attribute layout of the nodes before they were slotted
+    def __init__(self, link, requester, guildContext, duration, title):
+        self.link = link
+        self.requester = requester
+        self.guildContext = guildContext
+        self.duration = duration
+        self.title = title
+
+
+class LegacyYoutubeAudioNode(LegacyAudioNode):
+    def __init__(self, link, requester, guildContext, duration, title, uploader, thumbnailUrl):
+        super().__init__(link, requester, guildContext, duration, title)
+        self.uploader = uploader
+        self.thumbnailUrl = thumbnailUrl
+
+
+class LegacySpotifyAudioNode(LegacyAudioNode):
+    def __init__(self, spotifyId, requester, guildContext, duration, title, uploader, thumbnailUrl, albumName):
+        super().__init__(f"https://open.spotify.com/track/{spotifyId}", requester, guildContext, duration, title)
+        self.uploader = uploader
+        self.thumbnailUrl = thumbnailUrl
+        self.albumName = albumName
+        self.spotifyId = spotifyId
+
+
+class FakeUser:
+    id = 356482115161948171
+
+
+def makePayloads():
+    # goes through json so every track gets its own copies of the repeated strings, like api responses do
+    spotify = [{
+        "id": f"{i:022d}", "name": f"Track number {i}", "duration_ms": 200000 + i,
+        "artist": f"Artist {i // ALBUM_SIZE}", "album": f"Album {i // ALBUM_SIZE}",
+        "image": f"https://i.scdn.co/image/ab67616d0000b273{i // ALBUM_SIZE:024x}"
+    } for i in range(TRACKS)]
+    youtube = [{
+        "url": f"https://www.youtube.com/watch?v={i:011d}", "title": f"Video number {i}", "duration": 200 + i,
+        "uploader": f"Channel {i // ALBUM_SIZE}", "thumbnail": f"https://i.ytimg.com/vi/{i:011d}/hqdefault.jpg"
+    } for i in range(TRACKS)]
+    return json.loads(json.dumps(spotify)), json.loads(json.dumps(youtube))
+
+
+def measure(build) -> float:
+    # bytes the queue keeps alive once the api payloads are gone, strings included
+    tracemalloc.start()
+    spotify, youtube = makePayloads()
+    nodes = build(spotify, youtube)
+    del spotify, youtube
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained / len(nodes)
+
+
+def buildLegacy(spotify, youtube):
+    guildContext = object()
+    requester = FakeUser()
+    return [
+        LegacySpotifyAudioNode(track["id"], requester, guildContext, round(track["duration_ms"] / 1000),
+                               track["name"], track["artist"], track["image"], track["album"])
+        for track in spotify
+    ] + [
+        LegacyYoutubeAudioNode(video["url"], requester, guildContext, video["duration"], video["title"],
+                               video["uploader"], video["thumbnail"])
+        for video in youtube
+    ]
+
+
+def buildCompact(spotify, youtube):
+    requesterId = FakeUser.id
+    return [
+        SpotifyAudioNode(track["id"], requesterId, round(track["duration_ms"] / 1000), track["name"],
+                         track["artist"], track["image"], track["album"])
+        for track in spotify
+    ] + [
+        YoutubeAudioNode(video["url"], requesterId, video["duration"], video["title"], video["uploader"],
+                         video["thumbnail"])
+        for video in youtube
+    ]
+
+
+def main():
+    results = {}
+    for name, build in (("legacy", buildLegacy), ("compact", buildCompact)):
+        results[name] = {"bytesPerNode": round(measure(build), 1)}
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# CPU spent per stream by the two playback modes: ffmpeg to pcm + opus encoding in python (PlaybackMode.Pcm)
+# against ffmpeg handing out opus packets (PlaybackMode.Opus, stream copy for opus sources).
+# Frames are read as fast as possible instead of in real time, so the numbers are cpu seconds per audio second.
+# run from the repository root with: python -m benchmarks.playback_cpu [--file song.webm] [--streams 4]
+# (ffmpeg's own cpu is read from os.times(), which only reports child processes on unix)
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from nextcord import FFmpegOpusAudio, FFmpegPCMAudio
+from nextcord.opus import Encoder
+
+FRAME_LENGTH = 0.02  # seconds of audio in each frame
+
+
+def makeSampleFile(ffmpeg: str, seconds: int) -> str:
+    path = os.path.join(tempfile.mkdtemp(), "sample.webm")
+    subprocess.run([
+        ffmpeg, "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-ac", "2", "-c:a", "libopus", "-b:a", "128k", path
+    ], check=True)
+    return path
+
+
+def childrenCpu() -> float:
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def makeSource(mode: str, path: str, ffmpeg: str):
+    if mode == "opus":
+        return FFmpegOpusAudio(path, codec="opus", executable=ffmpeg, options="-vn")
+    return FFmpegPCMAudio(path, executable=ffmpeg, options="-vn")
+
+
+def run(mode: str, path: str, ffmpeg: str, streams: int) -> dict:
+    encoder = Encoder() if mode == "pcm" else None
+    pythonStart, ffmpegStart, wallStart = time.process_time(), childrenCpu(), time.perf_counter()
+
+    sources = [makeSource(mode, path, ffmpeg) for _ in range(streams)]
+    frames = 0
+    for source in sources:
+        while data := source.read():
+            if encoder is not None:
+                encoder.encode(data, Encoder.SAMPLES_PER_FRAME)  # what the voice client does with pcm sources
+            frames += 1
+        source.cleanup()
+
+    pythonCpu = time.process_time() - pythonStart
+    ffmpegCpu = childrenCpu() - ffmpegStart
+    audioSeconds = frames * FRAME_LENGTH
+    return {
+        "streams": streams,
+        "audioSeconds": round(audioSeconds, 2),
+        "wallSeconds": round(time.perf_counter() - wallStart, 3),
+        "pythonCpuSeconds": round(pythonCpu, 3),
+        "ffmpegCpuSeconds": round(ffmpegCpu, 3),
+        "cpuPerAudioSecond": round((pythonCpu + ffmpegCpu) / audioSeconds, 5) if audioSeconds else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default=None, help="audio file to play, a generated opus/webm tone by default")
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--seconds", type=int, default=120, help="length of the generated tone")
+    parser.add_argument("--streams", type=int, default=4)
+    args = parser.parse_args()
+
+    path = args.file or makeSampleFile(args.ffmpeg, args.seconds)
+    results = {mode: run(mode, path, args.ffmpeg, args.streams) for mode in ("pcm", "opus")}
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Cost of journaling queue mutations and time to rebuild a guild's queue from its journal on startup, for a queue
+# built like a big playlist import followed by some songs played, removed and moved around.
+# run from the repository root with: python -m benchmarks.queue_journal [--songs 10000]
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from cogs.music_cog import YoutubeAudioNode, nodeFromRecord
+from lib.queue_journal import QueueJournal
+from lib.track_queue import TrackQueue
+
+GUILD_ID = 1
+
+
+def makeNodes(count: int) -> list[YoutubeAudioNode]:
+    return [
+        YoutubeAudioNode(f"https://youtu.be/b{i:010d}", 356482115161948171, 180 + i % 240, f"Benchmark song {i}",
+                         f"Channel {i % 50}", f"https://i.ytimg.com/vi/b{i:010d}/hqdefault.jpg")
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=10000)
+    parser.add_argument("--mutations", type=int, default=2000)
+    parser.add_argument("--snapshot-every", type=int, default=500)
+    args = parser.parse_args()
+
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as directory:
+        queue = TrackQueue()
+        journal = QueueJournal(directory, GUILD_ID, lambda node: node.toRecord(), lambda: {
+            "queue": [node.toRecord() for node in queue], "playing": None, "startedAt": None, "loopMode": 0,
+            "voiceChannelId": None, "replyChannelId": None
+        }, snapshotEvery=args.snapshot_every)
+        queue.observer = journal
+
+        nodes = makeNodes(args.songs)
+        start = time.perf_counter()
+        for chunk in range(0, len(nodes), 100):  # added page by page, like a playlist import
+            queue.extend(nodes[chunk:chunk + 100])
+        importSeconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.mutations):
+            match random.randrange(3):
+                case 0:
+                    queue.get()
+                case 1:
+                    queue.remove(random.randrange(len(queue)))
+                case 2:
+                    queue.move(random.randrange(len(queue)), random.randrange(len(queue)))
+        mutationSeconds = (time.perf_counter() - start) / args.mutations
+        # songs added after the last snapshot are only in the journal, the restore below has to replay them
+        journal.snapshot()
+        queue.extend(makeNodes(10))
+        journal.close()
+        journalBytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+        start = time.perf_counter()
+        state = QueueJournal.load(directory, GUILD_ID)
+        restored = [nodeFromRecord(record) for record in state["queue"]]
+        restoreSeconds = time.perf_counter() - start
+        assert [node.getLink() for node in restored] == [node.getLink() for node in queue]
+
+    results = {
+        "songs": args.songs,
+        "importSeconds": round(importSeconds, 5),
+        "secondsPerMutation": round(mutationSeconds, 7),
+        "journalBytes": journalBytes,
+        "restoreSeconds": round(restoreSeconds, 5),
+        "restoredSongs": len(restored)
+    }
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Cost of one click through the pages of a big queue: formatting the page from scratch like /queue used to,
+# against the memoized renderer, with nothing changing, with songs being appended and with songs finishing.
+# run from the repository root with: python -m benchmarks.queue_pages [--songs 2000]
+import argparse
+import json
+import time
+
+from cogs.music_cog import YoutubeAudioNode
+from lib.functions import formatDuration
+from lib.queue_pages import QueuePageRenderer
+from lib.track_queue import TrackQueue
+
+PAGE_SIZE = 15
+
+
+def makeNode(i: int) -> YoutubeAudioNode:
+    return YoutubeAudioNode(f"https://youtu.be/{i:011d}", 1, 180 + i % 120, f"Song number {i} - Some Artist", "Some Artist",
+                            None)
+
+
+def legacyPage(queue: TrackQueue, page: int) -> str:
+    songList = [{
+        "duration": node.getDuration(),
+        "url": node.getLink(),
+        "title": node.getTitle()
+    } for node in list(queue)[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]]
+    return "\n".join([f"**Page {page + 1}:**"] + [
+        f"``[{1 + i + page * PAGE_SIZE:02}]``\\[[{formatDuration(song['duration'])}]({song['url']})\\] ``{song['title']:.50}``"
+        for i, song in enumerate(songList)
+    ])
+
+
+def timeClicks(render, queue: TrackQueue, mutate=None) -> float:
+    pageCount = -(-len(queue) // PAGE_SIZE)
+    start = time.perf_counter()
+    for page in range(pageCount):
+        if mutate is not None:
+            mutate(queue, page)
+        render(page)
+    return (time.perf_counter() - start) / pageCount
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", type=int, default=2000)
+    args = parser.parse_args()
+
+    queue = TrackQueue()
+    queue.extend([makeNode(i) for i in range(args.songs)])
+    renderer = QueuePageRenderer(queue, YoutubeAudioNode.getQueueRow, PAGE_SIZE)
+    timeClicks(renderer.render, queue)  # fills the caches, like the first time someone pages through
+
+    legacy = lambda page: legacyPage(queue, page)
+    scenarios = {
+        "unchanged": None,
+        "appending": lambda q, page: q.put(makeNode(args.songs + page)),
+        "songFinishing": lambda q, page: q.put(q.get())
+    }
+    results = {"songs": args.songs}
+    for name, mutate in scenarios.items():
+        # seconds per click, mutation included
+        results[name] = {
+            "legacy": round(timeClicks(legacy, queue, mutate), 8),
+            "renderer": round(timeClicks(renderer.render, queue, mutate), 8)
+        }
+    results["renderer"] = renderer.getStats()
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
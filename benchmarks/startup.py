@@ -0,0 +1,59 @@
+# Time from starting python to having BotMain built (client, cogs and commands loaded, right before connecting),
+# with yt_dlp/spotipy imported lazily against importing them up front like the bot used to.
+# Each run is a fresh interpreter so nothing is already in sys.modules.
+# run from the repository root with: python -m benchmarks.startup [--runs 5]
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import time
+start = time.perf_counter()
+if {eager}:
+    import yt_dlp, spotipy, spotipy.oauth2
+imported = time.perf_counter()
+import bot
+botMain = bot.BotMain()
+built = time.perf_counter()
+cog = botMain.client.get_cog("MusicCog")
+try:
+    cog.warmUp()
+except (AttributeError, KeyError):
+    pass  # no cog or no spotify credentials, the modules are loaded anyway
+warmed = time.perf_counter()
+print(imported - start, built - start, warmed - start)
+"""
+
+
+def runOnce(eager: bool) -> tuple[float, ...]:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(eager=eager)], check=True, capture_output=True, text=True
+    ).stdout
+    return tuple(float(value) for value in output.split()[-3:])
+
+
+def run(eager: bool, runs: int) -> dict:
+    samples = [runOnce(eager) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "eagerImportSeconds": round(statistics.median(sample[0] for sample in samples), 4),
+        "readyToConnectSeconds": round(statistics.median(sample[1] for sample in samples), 4),
+        "warmSeconds": round(statistics.median(sample[2] for sample in samples), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {mode: run(mode == "eager", args.runs) for mode in ("eager", "lazy")}
+    results["speedup"] = round(results["eager"]["readyToConnectSeconds"] / results["lazy"]["readyToConnectSeconds"], 2)
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
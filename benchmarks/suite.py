@@ -0,0 +1,313 @@
+# Offline benchmark suite: the music cog runs against the stand-ins in benchmarks/fakes.py instead of yt-dlp, spotify
+# and a voice connection, and the results are written as json so two releases can be compared.
+# run from the repository root with: python -m benchmarks.suite [--output results.json] [--baseline old.json]
+# with --baseline, metrics that got worse by more than --tolerance are listed and the exit code is 1.
+# (ffmpeg isn't started: the audio source is faked, so playNext is timed without process startup)
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import lib.extraction_service as extraction_service
+from benchmarks.fakes import FakeAudioSource, FakeBotMain, FakeExtractorSettings, FakeGuild, FakeSpotify, \
+    FakeTextChannel, FakeUser, fakeYtDlp
+from cogs.music_cog import GuildVoiceContext, MusicCog, NowPlayingPresenter, YoutubeAudioNode
+
+# higher is better for these, lower for everything else
+HIGHER_IS_BETTER = ("PerSecond", "restCallsSaved")
+
+
+def makeCog(path: str) -> MusicCog:
+    extraction_service.yt_dlp = fakeYtDlp
+    with open(os.path.join(path, "config.json"), "w", encoding="utf8") as f:
+        # the fakes only exist in this process, queues aren't journaled between runs and there's no ffmpeg to
+        # measure loudness with
+        json.dump({"extraction": {"processes": 0}, "persistence": {"enabled": False}, "loudness": {"enabled": False}},
+                  f)
+    cog = MusicCog(None, FakeBotMain(path))
+    cog._MusicCog__spotifyClient = FakeSpotify()
+    return cog
+
+
+def makeGuildContext(cog: MusicCog, guildId: int, trackLength: float = 0.0) -> GuildVoiceContext:
+    guildContext = cog.getGuildContext(FakeGuild(guildId, trackLength))
+    guildContext.replyChannel = FakeTextChannel()
+
+    async def makeAudioSource(stream: dict, startAt: float = 0.0):
+        return FakeAudioSource(stream)
+
+    guildContext.makeAudioSource = makeAudioSource
+    return guildContext
+
+
+def consume(addedData) -> list:
+    nodes = list(addedData.songs)
+    for page in addedData.pages or ():
+        addedData.addPage(page)
+        nodes.extend(page)
+    return nodes
+
+
+def benchInterpretRequest(guildContext: GuildVoiceContext, requests: int) -> dict:
+    factory = guildContext.nodePseudoFactory
+    requester = FakeUser()
+    kinds = {
+        "video": lambda i: f"https://youtu.be/v{i:010d}",
+        "search": lambda i: f"some song number {i} official audio",
+        "youtubePlaylist": lambda i: f"https://www.youtube.com/playlist?list=PL{i:06d}",
+        "spotifyTrack": lambda i: f"https://open.spotify.com/track/{i:022d}",
+        "spotifyAlbum": lambda i: f"https://open.spotify.com/album/{i:012d}{'a' * 10}",
+        "spotifyPlaylist": lambda i: f"https://open.spotify.com/playlist/{i:012d}{'p' * 10}"
+    }
+    results = {}
+    for kind, makeLink in kinds.items():
+        count = requests if kind in ("video", "search", "spotifyTrack") else max(1, requests // 20)
+        nodes = 0
+        start = time.perf_counter()
+        for i in range(count):
+            nodes += len(consume(factory.interpretRequest(makeLink(i), requester)))
+        elapsed = time.perf_counter() - start
+        results[kind] = {
+            "requests": count,
+            "requestsPerSecond": round(count / elapsed, 2),
+            "nodesPerSecond": round(nodes / elapsed, 2)
+        }
+    return results
+
+
+def benchPlaylistStreaming(guildContext: GuildVoiceContext, size: int, pageLatency: float) -> dict:
+    # how long a big youtube playlist takes until its first songs can be queued, and until all of it is
+    FakeExtractorSettings.playlistSize, FakeExtractorSettings.latency = size, pageLatency
+    jobs = guildContext.cogMain.extractionService.jobs
+    try:
+        start = time.perf_counter()
+        addedData = guildContext.nodePseudoFactory.interpretRequest(
+            "https://www.youtube.com/playlist?list=PLstream", FakeUser()
+        )
+        firstSongs = time.perf_counter() - start
+        nodes = consume(addedData)
+        allSongs = time.perf_counter() - start
+    finally:
+        FakeExtractorSettings.playlistSize, FakeExtractorSettings.latency = 200, 0.0
+    return {
+        "entries": size,
+        "songs": len(nodes),
+        "skipped": len(addedData.skipped),
+        "extractions": guildContext.cogMain.extractionService.jobs - jobs,
+        "firstSongsSeconds": round(firstSongs, 5),
+        "allSongsSeconds": round(allSongs, 5)
+    }
+
+
+async def waitUntilIdle(guildContext: GuildVoiceContext, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    voiceClient = guildContext.guild.voice_client
+    while (guildContext.nodePlaying is not None or voiceClient.is_playing()) and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def benchTransitions(cog: MusicCog, tracks: int, extractionLatency: float) -> dict:
+    results = {}
+    FakeExtractorSettings.latency = extractionLatency
+    for guildId, depth in enumerate((0, 2), start=100):
+        guildContext = makeGuildContext(cog, guildId, trackLength=0.05)
+        guildContext.preResolver.setDepth(depth)
+        await guildContext.commandHandler.enqueue([
+            YoutubeAudioNode(f"https://youtu.be/t{guildId:03d}{i:07d}", FakeUser.id, 1, f"Track {i}", "Uploader", None)
+            for i in range(tracks)
+        ])
+        await guildContext.wakeUp()
+        await waitUntilIdle(guildContext)
+        await asyncio.sleep(NowPlayingPresenter.DEBOUNCE + 0.1)  # lets the last now playing update go out
+        gaps = guildContext.transitionScheduler.gaps.summary()
+        results[f"lookahead{depth}"] = {
+            "transitions": gaps["count"],
+            "gapMeanSeconds": round(gaps["mean"], 5),
+            "gapP95Seconds": round(gaps["p95"], 5),
+            "commandP95Seconds": round(guildContext.commandHandler.latency.quantile(0.95), 5),
+            "restCalls": guildContext.nowPlaying.getStats()["restCalls"],
+            "restCallsSaved": guildContext.nowPlaying.getStats()["restCallsSaved"]
+        }
+    FakeExtractorSettings.latency = 0.0
+    return results
+
+
+async def benchSeek(cog: MusicCog, seeks: int, extractionLatency: float) -> dict:
+    # seeking around a 3 hour mix, the stream it was resolved to is opened again at the new position
+    FakeExtractorSettings.latency = extractionLatency
+    guildContext = makeGuildContext(cog, 400, trackLength=3 * 60 * 60)
+    await guildContext.commandHandler.enqueue([
+        YoutubeAudioNode("https://youtu.be/s0000000001", FakeUser.id, 3 * 60 * 60, "Mix", "Uploader", None)
+    ])
+    await guildContext.wakeUp()
+    jobs = cog.extractionService.jobs
+    seconds = []
+    for i in range(seeks):
+        start = time.perf_counter()
+        await guildContext.seek((i * 7919) % (3 * 60 * 60))
+        seconds.append(time.perf_counter() - start)
+    extractions = cog.extractionService.jobs - jobs
+    await guildContext.stop()
+    FakeExtractorSettings.latency = 0.0
+    seconds.sort()
+    return {
+        "seeks": seeks,
+        "seekMeanSeconds": round(sum(seconds) / len(seconds), 5),
+        "seekP95Seconds": round(seconds[int(len(seconds) * 0.95)], 5),
+        "extractions": extractions
+    }
+
+
+async def benchQueueRendering(cog: MusicCog, songs: int) -> dict:
+    guildContext = makeGuildContext(cog, 200)
+    await guildContext.commandHandler.enqueue([
+        YoutubeAudioNode(f"https://youtu.be/q{i:010d}", FakeUser.id, 200 + i % 100, f"Queued song {i}", "Uploader", None)
+        for i in range(songs)
+    ])
+    pageCount = guildContext.queuePages.pageCount()
+
+    def timePages() -> float:
+        start = time.perf_counter()
+        for page in range(pageCount):
+            MusicCog.makeQueueEmbed(guildContext, page)
+        return (time.perf_counter() - start) / pageCount
+
+    cold = timePages()
+    warm = timePages()
+    addedData = guildContext.nodePseudoFactory.interpretRequest("https://www.youtube.com/playlist?list=PLembed", FakeUser())
+    start = time.perf_counter()
+    for _ in range(100):
+        addedData.getEmbed()
+    return {
+        "songs": songs,
+        "pages": pageCount,
+        "coldSecondsPerPage": round(cold, 7),
+        "warmSecondsPerPage": round(warm, 7),
+        "songAddedEmbedSeconds": round((time.perf_counter() - start) / 100, 7)
+    }
+
+
+def benchNodeMemory(guildContext: GuildVoiceContext, collections: int) -> dict:
+    # bytes each queued node keeps alive once the api payloads are gone
+    factory = guildContext.nodePseudoFactory
+    requester = FakeUser()
+    results = {}
+    for kind, makeLink in (
+            ("youtube", lambda i: f"https://www.youtube.com/playlist?list=PLmem{i:05d}"),
+            ("spotify", lambda i: f"https://open.spotify.com/album/mem{i:09d}{'m' * 10}")
+    ):
+        gc.collect()
+        tracemalloc.start()
+        nodes = []
+        for i in range(collections):
+            nodes.extend(consume(factory.interpretRequest(makeLink(i), requester)))
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[kind] = {"nodes": len(nodes), "bytesPerNode": round(retained / len(nodes), 1)}
+    return results
+
+
+def getCommit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def findRegressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    current, previous = flatten(results["benchmarks"]), flatten(baseline["benchmarks"])
+    regressions = []
+    for key, value in current.items():
+        old = previous.get(key, None)
+        if not old:
+            continue
+        change = (value - old) / abs(old)
+        if key.endswith(HIGHER_IS_BETTER):
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{key}: {old} -> {value} ({change:+.0%} worse)")
+    return regressions
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as path:
+        cog = makeCog(path)
+        try:
+            guildContext = makeGuildContext(cog, 1)
+            benchmarks = {
+                "interpretRequest": benchInterpretRequest(guildContext, args.requests),
+                "playlistStreaming": benchPlaylistStreaming(guildContext, args.playlist_entries,
+                                                            args.extraction_latency),
+                "transitions": await benchTransitions(cog, args.tracks, args.extraction_latency),
+                "seek": await benchSeek(cog, args.seeks, args.extraction_latency),
+                "queueRendering": await benchQueueRendering(cog, args.queue_songs),
+                "nodeMemory": benchNodeMemory(makeGuildContext(cog, 300), args.memory_collections)
+            }
+        finally:
+            for guildContext in cog.guildContexts.values():
+                guildContext.nowPlaying.close()
+                guildContext.commandHandler.close()
+            cog.cog_unload()
+    return {
+        "commit": getCommit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "arguments": vars(args),
+        "benchmarks": benchmarks
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=None, help="json file to write, data/benchmarks/<date>.json by default")
+    parser.add_argument("--baseline", default=None, help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="fraction a metric may get worse by")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--tracks", type=int, default=40)
+    parser.add_argument("--extraction-latency", type=float, default=0.02)
+    parser.add_argument("--queue-songs", type=int, default=2000)
+    parser.add_argument("--playlist-entries", type=int, default=1000)
+    parser.add_argument("--seeks", type=int, default=50)
+    parser.add_argument("--memory-collections", type=int, default=20)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    output = args.output or os.path.join("data", "benchmarks", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["benchmarks"], indent=2))
+    print(f"written to {output}")
+
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf8") as f:
+            regressions = findRegressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("regression:", regression)
+        if regressions:
+            sys.exit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -19,22 +19,45 @@ class BotMain:
         token_key = "viktor-beta" if beta else "viktor"
         self.path = os.path.dirname(os.path.abspath(__file__))
 
-        intents = nextcord.Intents.all()
+        self.config = getJson(self.path + "/config.json")
         self.description = "Testing out the waters"
-        self.client = commands.Bot(command_prefix=prefixes, intents=intents)
+        self.client = commands.Bot(command_prefix=prefixes, **self.getGatewayOptions())
         self.client.remove_command("help")
         self.client.event(self.on_ready)
         self.__addCogs()
+        self.token = getJson(self.path+"/cred/dicord_tokens.json").get(token_key, None)
 
-        token = getJson(self.path+"/cred/dicord_tokens.json").get(token_key, None)
-        self.client.run(token)
-
+    def run(self):
+        # only nextcord's warnings and errors, at DEBUG it logs every gateway event and payload
         logger = logging.getLogger('nextcord')
-        logger.setLevel(logging.DEBUG)
+        logger.setLevel(logging.WARNING)
         handler = logging.FileHandler(filename='nextcord.log', encoding='utf-8', mode='w')
         handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
         logger.addHandler(handler)
 
+        viktorLogger = logging.getLogger('viktor')
+        viktorLogger.setLevel(logging.INFO)
+        viktorHandler = logging.FileHandler(filename='viktor.log', encoding='utf-8', mode='a')
+        viktorHandler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+        viktorLogger.addHandler(viktorHandler)
+
+        self.client.run(self.token)
+
+    def getGatewayOptions(self) -> dict:
+        if not self.config.get("gateway", {}).get("lean", True):
+            return {"intents": nextcord.Intents.all()}
+        # lean mode: slash commands come as interactions, so only guilds and voice states are needed.
+        # members are only cached while in a voice channel, and guilds aren't chunked at startup.
+        # prefixed commands stop working, since reading messages needs the message content intent
+        intents = nextcord.Intents.none()
+        intents.guilds = True
+        intents.voice_states = True
+        return {
+            "intents": intents,
+            "member_cache_flags": nextcord.MemberCacheFlags.from_intents(intents),
+            "chunk_guilds_at_startup": False
+        }
+
     def __addCogs(self):
         dir_path = os.path.dirname(os.path.realpath(__file__))
         cogs_path = "./cogs"
@@ -52,4 +75,6 @@ class BotMain:
         print('The BOTty is reacting!')
 
 
-botmain = BotMain()
+if __name__ == "__main__":
+    botmain = BotMain()
+    botmain.run()
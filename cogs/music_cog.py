@@ -1,21 +1,35 @@
-import queue
 from typing import Tuple
 
 import nextcord
 from nextcord.ext.commands import Cog
 from nextcord import Interaction, Embed, VoiceChannel, VoiceClient, Guild, TextChannel, FFmpegPCMAudio, User, Color, \
-    SlashOption
+    SlashOption, FFmpegOpusAudio, AudioSource, HTTPException, NotFound, Message, Permissions
 from lib.command_decorators import slash_command
-from lib.functions import formatDuration, isUrlValid, getJson
-from queue import Queue
+from lib.functions import formatDuration, getJson, internOptional, parseTimestamp
+from lib.extraction import ExtractionExecutor
+from lib.extraction_service import ExtractionService, ExtractionTimeoutException
+from lib.caches import StreamUrlCache, SearchCache
+from lib.match_store import SpotifyMatchStore
+from lib.track_queue import TrackQueue
+from lib.queue_pages import QueuePageRenderer
+from lib.queue_journal import QueueJournal, DisabledQueueJournal
+from lib.metrics import Histogram, MetricsRegistry
+from lib.metrics_server import PrometheusEndpoint
+from lib.audio_cache import AudioFileCache
+from lib.loudness import LoudnessStore
+from lib.link_classifier import MediaType, Provider, classifyRequest
+from lib.lazy import LazyModule
 from enum import Enum
-from yt_dlp import YoutubeDL
 from abc import ABC as ABSTRACT, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 import re
+import asyncio
+import functools
+import logging
+import os
 import threading
-from typing import Optional, Union
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import time
+from typing import Optional, Union, Iterator, Callable, Awaitable
 
 
 class UserNotInVoiceChannel(Exception):
@@ -38,26 +52,36 @@ class UnavailableSourceException(Exception):
     pass
 
 
+class PlaybackMode(Enum):
+    Pcm = 0  # ffmpeg decodes to pcm and nextcord encodes the opus frames
+    Opus = 1  # ffmpeg outputs opus, stream-copied when the source already is opus
+
+
 class LoopMode(Enum):
     Disabled = 0
     Song = 1
     Queue = 2
 
 
-class MediaType(Enum):
-    Song = 0
-    Video = 1
-    Playlist = 2
-    Album = 3
-    Artist = 4
-    Episode = 5
+# imported on first use or warmed up after on_ready, importing spotipy takes a good part of the startup
+# (yt-dlp is imported by the extraction service, in its worker processes when they are enabled)
+spotipy = LazyModule("spotipy")
+spotipyOauth = LazyModule("spotipy.oauth2")
+
+# options profiles of the extraction service, see MusicCog.YDL_OPTIONS_FOR_AUDIO and YDL_OPTIONS_PLAYLIST
+AUDIO_PROFILE = "audio"
+PLAYLIST_PROFILE = "playlist"
+
+VIDEO_ID_PATTERN = re.compile(r"(?:v=|/)([0-9A-Za-z_-]{11})")
 
 
 class AudioNode(ABSTRACT):
-    def __init__(self, link: str, requester: User, guildContext: "GuildVoiceContext", duration: int, title: str):
-        self.link: str = link
-        self.requester: User = requester
-        self.guildContext: "GuildVoiceContext" = guildContext
+    # Nodes are slotted and only keep the requester's id, since big queues hold thousands of them. Strings
+    # repeated across nodes (uploaders, album names and images) are interned so each one is stored once.
+    __slots__ = ("requesterId", "duration", "title")
+
+    def __init__(self, requesterId: int, duration: int, title: str):
+        self.requesterId: int = requesterId
         self.duration: int = duration  # in seconds
         self.title: str = title
 
@@ -67,50 +91,79 @@ class AudioNode(ABSTRACT):
     def getTitle(self):
         return self.title
 
-    def getLink(self):
-        return self.link
+    @abstractmethod
+    def getLink(self) -> str:
+        pass
 
     def getImageUrl(self) -> Optional[str]:
         return None
 
+    def getQueueRow(self) -> str:
+        return f"\\[[{formatDuration(self.getDuration())}]({self.getLink()})\\] ``{self.getTitle():.50}``"
+
     @abstractmethod
-    def getSource(self):
+    def getStream(self, guildContext: "GuildVoiceContext") -> dict:
+        # the resolved stream: its url plus what is known about its format (acodec, abr, ext)
         raise InvalidLinkException
 
+    def getSource(self, guildContext: "GuildVoiceContext") -> str:
+        return self.getStream(guildContext)["url"]
+
     @abstractmethod
     def makeEmbed(self) -> Embed:
         pass
 
+    @abstractmethod
+    def toRecord(self) -> list:
+        # what the queue journal stores, enough to rebuild the node without resolving it again
+        pass
+
 
 class YoutubeAudioNode(AudioNode):
-    def __init__(self, link: str, requester: User, guildContext: "GuildVoiceContext",
-                 duration: int, title: str, uploader: str, thumbnailUrl: str):
-        super().__init__(link, requester, guildContext, duration, title)
-        self.uploader: str = uploader
+    __slots__ = ("link", "uploader", "thumbnailUrl")
+
+    def __init__(self, link: str, requesterId: int, duration: int, title: str, uploader: str, thumbnailUrl: str):
+        super().__init__(requesterId, duration, title)
+        self.link: str = link
+        self.uploader: str = internOptional(uploader)
         self.thumbnailUrl = thumbnailUrl
 
+    def getLink(self):
+        return self.link
+
     def getImageUrl(self) -> Optional[str]:
         return self.thumbnailUrl
 
-    # TODO handle exceptions
+    def toRecord(self) -> list:
+        return ["y", self.link, self.requesterId, self.duration, self.title, self.uploader, self.thumbnailUrl]
+
     @staticmethod
-    def getInfo(link, YDL_OPTIONS):
-        with YoutubeDL(YDL_OPTIONS) as ydl:
-            info = ydl.extract_info(link, download=False)
-            if info is None:
-                raise InvalidLinkException()
-            return info
-
-    def getSource(self):
-        info = self.getInfo(self.getLink(), self.guildContext.YDL_OPTIONS_FOR_AUDIO)
-        audioSource = info.get("url", "Unknown")
-        try:
-            self.thumbnailUrl = info["thumbnails"][-1]["url"]
-        except KeyError:
-            self.thumbnailUrl = None
+    def getInfo(link, guildContext: "GuildVoiceContext"):
+        info = guildContext.extractInfo(AUDIO_PROFILE, link)
+        if info is None:
+            raise InvalidLinkException()
+        return info
+
+    def resolveInfo(self, guildContext: "GuildVoiceContext") -> dict:
+        def resolver():
+            with guildContext.span("extract_info"):
+                return self.getInfo(self.getLink(), guildContext)
+
+        videoId = self.getVideoId(self.getLink())
+        if videoId is None:
+            return StreamUrlCache.trimInfo(resolver())
+        return guildContext.cogMain.streamCache.getOrResolve(videoId, resolver)
+
+    def getStream(self, guildContext: "GuildVoiceContext") -> dict:
+        audioCache: Optional[AudioFileCache] = guildContext.cogMain.audioCache
+        if audioCache is not None and (local := audioCache.getStream(self.getVideoId(self.getLink()))) is not None:
+            return local
+        info = self.resolveInfo(guildContext)
+        audioSource = info.get("url", None) or "Unknown"
+        self.thumbnailUrl = info.get("thumbnail", None)
         if audioSource == "Unknown":
             raise InvalidLinkException()
-        return audioSource
+        return info
 
     def makeEmbed(self) -> Embed:
         sourceEmoji = "🎶"
@@ -122,67 +175,66 @@ class YoutubeAudioNode(AudioNode):
         )
         embed.set_thumbnail(self.thumbnailUrl)
         embed.set_author(name="NOW PLAYING")  # , icon_url=self.nodeBeingPlayed.getImageAddedBy())
-        embed.add_field(name="Added By", value=f"<@{self.requester.id}>", inline=True)
+        embed.add_field(name="Added By", value=f"<@{self.requesterId}>", inline=True)
         embed.add_field(name="Duration", value=formatDuration(self.duration), inline=True)
         embed.add_field(name="Song By", value=self.uploader, inline=True)
         return embed
 
-    # TODO handle exceptions
     @staticmethod
-    def getInfoPlaylist(link, YDL_OPTIONS):
-        with YoutubeDL(YDL_OPTIONS) as ydl:
-            info = ydl.extract_info(link, download=False)
-            if info is None:
-                raise InvalidLinkException()
-            return info
-
-    @staticmethod
-    def isYoutubeLink(link):
-        link = re.findall(r'(?:https?://)?(?:[-\w.]|(?:%[\da-fA-F]{2}))+', link)[0]  # simplify link
-        return any(option in link for option in ["youtube", "youtu.be"])
+    def getInfoPlaylist(link, guildContext: "GuildVoiceContext", params: Optional[dict] = None):
+        info = guildContext.extractInfo(PLAYLIST_PROFILE, link, params)
+        if info is None:
+            raise InvalidLinkException()
+        return info
 
     @staticmethod
-    def parseYoutubeURL(url: str) -> tuple[MediaType, str]:
-        # validated from https://gist.githubusercontent.com/rodrigoborgesdeoliveira/987683cfbfcc8d800192da1e73adc486
-        if "attribution" in url:
-            url = url.replace("attribution", "attr")
-            url = url.replace("watch%3Fv%3D", "watch?v=")
-        if "oembed" in url:
-            url = url.replace("watch?v%3D", "watch?v=")
-
-        data = re.findall(r"(?:v=|\/)([0-9A-Za-z_-]{11}).*", url)
-        if data:
-            return MediaType.Video, f"https://youtu.be/{data[0]}"
-
-        data = re.findall(r"^.*?(?:v|list)=(.*?)(?:&|$)", url)
-        if data:
-            return MediaType.Playlist, f"https://youtube.com/playlist?list={data[0]}"
-
-        raise InvalidLinkException()
+    def getVideoId(url: str) -> Optional[str]:
+        match = VIDEO_ID_PATTERN.search(url)
+        return match.group(1) if match else None
 
     @staticmethod
-    def searchYTFirstResult(query, YDL_OPTIONS):
-        try:
-            with YoutubeDL(YDL_OPTIONS) as ydl:
-                info = ydl.extract_info("ytsearch:%s" % query, download=False)
-                return info['entries'][0]
-        except IndexError:
+    def searchYTFirstResult(query, guildContext: "GuildVoiceContext", exclude: Optional[set[str]] = None):
+        # when some videos are excluded a few more results are fetched to pick the first acceptable one
+        count = 5 if exclude else 1
+        info = guildContext.extractInfo(AUDIO_PROFILE, "ytsearch%d:%s" % (count, query))
+        if info is None:
             raise NoSearchResultsException
+        entries = [entry for entry in info['entries'] if not exclude or entry.get("id", None) not in exclude]
+        if len(entries) <= 0:
+            raise NoSearchResultsException
+        return entries[0]
 
 
 class SpotifyAudioNode(AudioNode):
 
-    def __init__(self, spotifyId: str, requester: User, guildContext: "GuildVoiceContext",
-                 duration: int, title: str, uploader: str, thumbnailUrl, albumName: str):
-        super().__init__(f"https://open.spotify.com/track/{spotifyId}", requester, guildContext, duration, title)
-        self.uploader: str = uploader
-        self.thumbnailUrl = thumbnailUrl
-        self.albumName = albumName
-        self.spotifyId = spotifyId
+    __slots__ = ("spotifyId", "uploader", "thumbnailUrl", "albumName", "youtubeId")
+
+    def __init__(self, spotifyId: str, requesterId: int, duration: int, title: str, uploader: str, thumbnailUrl,
+                 albumName: str):
+        super().__init__(requesterId, duration, title)
+        self.spotifyId: str = spotifyId
+        self.uploader: str = internOptional(uploader)
+        self.thumbnailUrl = internOptional(thumbnailUrl)
+        self.albumName: str = internOptional(albumName)
+        self.youtubeId: Optional[str] = None  # set once the youtube search has matched this track
+
+    def getLink(self):
+        return f"https://open.spotify.com/track/{self.spotifyId}"
 
     def getImageUrl(self) -> Optional[str]:
         return self.thumbnailUrl
 
+    def toRecord(self) -> list:
+        return ["s", self.spotifyId, self.requesterId, self.duration, self.title, self.uploader, self.thumbnailUrl,
+                self.albumName, self.youtubeId]
+
+    @staticmethod
+    def fromRecord(spotifyId, requesterId, duration, title, uploader, thumbnailUrl, albumName, youtubeId) \
+            -> "SpotifyAudioNode":
+        node = SpotifyAudioNode(spotifyId, requesterId, duration, title, uploader, thumbnailUrl, albumName)
+        node.youtubeId = youtubeId
+        return node
+
     def makeEmbed(self) -> Embed:
         sourceEmoji = "🎶"
         desc = f"{sourceEmoji} ``{self.getTitle()}``"
@@ -193,71 +245,93 @@ class SpotifyAudioNode(AudioNode):
         )
         embed.set_thumbnail(self.thumbnailUrl)
         embed.set_author(name="NOW PLAYING")  # , icon_url=self.nodeBeingPlayed.getImageAddedBy())
-        embed.add_field(name="Added By", value=f"<@{self.requester.id}>", inline=True)
+        embed.add_field(name="Added By", value=f"<@{self.requesterId}>", inline=True)
         embed.add_field(name="Duration", value=formatDuration(self.duration), inline=True)
         embed.add_field(name="Song By", value=self.uploader, inline=True)
         return embed
 
-    def getYoutubeInfo(self):
+    def getYoutubeInfo(self, guildContext: "GuildVoiceContext"):
         q = "{}, {}, {}".format(
             self.title,
             self.uploader,
             self.albumName
         )
-        return YoutubeAudioNode.searchYTFirstResult(q, self.guildContext.YDL_OPTIONS_FOR_AUDIO)
-
-    def getSource(self):
-        info = self.getYoutubeInfo()
-        audioSource = info.get("url", "Unknown")
+        matchStore: SpotifyMatchStore = guildContext.cogMain.matchStore
+        exclude = matchStore.getRejected(self.spotifyId)
+        with guildContext.span("extract_info"):
+            return YoutubeAudioNode.searchYTFirstResult(q, guildContext, exclude=exclude)
+
+    def getStream(self, guildContext: "GuildVoiceContext") -> dict:
+        streamCache: StreamUrlCache = guildContext.cogMain.streamCache
+        matchStore: SpotifyMatchStore = guildContext.cogMain.matchStore
+        if self.youtubeId is not None and self.youtubeId in matchStore.getRejected(self.spotifyId):
+            self.youtubeId = None  # /rematch'ed since this node was matched, maybe in another guild or before a restart
+        if self.youtubeId is None and (match := matchStore.getMatch(self.spotifyId)) is not None:
+            self.youtubeId = match.youtubeId
+        audioCache: Optional[AudioFileCache] = guildContext.cogMain.audioCache
+        if audioCache is not None and (local := audioCache.getStream(self.youtubeId)) is not None:
+            return local
+        if self.youtubeId is not None:
+            def resolver():
+                with guildContext.span("extract_info"):
+                    return YoutubeAudioNode.getInfo(f"https://youtu.be/{self.youtubeId}", guildContext)
+
+            info = streamCache.getOrResolve(self.youtubeId, resolver)
+        else:
+            info = self.getYoutubeInfo(guildContext)
+            self.youtubeId = info.get("id", None)
+            if self.youtubeId is not None:
+                confidence, durationDelta = SpotifyMatchStore.calculateConfidence(
+                    self.duration, info.get("duration", None)
+                )
+                matchStore.putMatch(self.spotifyId, self.youtubeId, confidence, durationDelta)
+                info = streamCache.putInfo(self.youtubeId, info)
+            else:
+                info = StreamUrlCache.trimInfo(info)
+        audioSource = info.get("url", None) or "Unknown"
         if audioSource == "Unknown":
             raise InvalidLinkException()
-        return audioSource
+        return info
 
-    @staticmethod
-    def isSpotifyLink(link):
-        # return bool(re.findall(r"^(?:https?://)?open.spotify.com/(?:album|track|playlist)/(?:\d|[a-z]|[A-Z]){22}",
-        # link))
-        return bool(re.findall(r"^(?:https?://)?open.spotify.com", link))
 
-    @staticmethod
-    def parseSpotifyURL(url: str) -> tuple[MediaType, str] | tuple[None, None]:
-        results = re.findall(
-            r"^(?:https?://)?open.spotify.com/(album|track|playlist|artist)/((?:\d|[a-z]|[A-Z]){22})"
-            , url)
-        if len(results) <= 0 or len(results[0]) < 2 or len(results[0][1]) != 22:
-            return None, None
-        match results[0][0]:
-            case "album":
-                return MediaType.Album, results[0][1]
-            case "playlist":
-                return MediaType.Playlist, results[0][1]
-            case "track":
-                return MediaType.Song, results[0][1]
-            case "artist":
-                return MediaType.Artist, results[0][1]
-            case _:
-                return None, None
-
-
-test = False
-if test:
-    uLink = "https://open.spotify.com/playlist/7hGG8g2WqzRN0fcc1fg2T9"
-    print(SpotifyAudioNode.isSpotifyLink(uLink))
-    print(SpotifyAudioNode.parseSpotifyURL(uLink))
+def nodeFromRecord(record: list) -> AudioNode:
+    kind, *fields = record
+    if kind == "y":
+        return YoutubeAudioNode(*fields)
+    if kind == "s":
+        return SpotifyAudioNode.fromRecord(*fields)
+    raise ValueError(f"unknown node record {kind!r}")
 
 
 class SongAddedData:
-    def __init__(self, song: Union[AudioNode, list[AudioNode]], image=None):
+    def __init__(self, song: Union[AudioNode, list[AudioNode]], image=None,
+                 pages: Optional[Iterator[list[AudioNode]]] = None, skipped: Optional[list[str]] = None):
         self.songs: list[AudioNode] = song if type(song) == list else [song]
         self.image = image
+        self.count = len(self.songs)
+        # the rest of a big playlist/album, fetched one page at a time after the first one was queued
+        self.pages: Optional[Iterator[list[AudioNode]]] = pages
+        self.failed = False  # fetching a page raised, the songs queued so far stay
+        self.skipped: list[str] = skipped if skipped is not None else []  # titles of entries that can't be played
+        self.rows: Optional[str] = None  # the first songs never change, so they are formatted once
 
-    def getEmbed(self):
+    def addPage(self, nodes: list[AudioNode]):
+        self.count += len(nodes)
 
-        desc = "\n".join([
-            f"\\[[{formatDuration(song.getDuration())}]({song.getLink()})\\] ``{song.getTitle():.50}`` "
-            for song in self.songs[:15]])
-        if (remSongs := len(self.songs[15:])) > 0:
+    def getEmbed(self):
+        if self.rows is None:
+            self.rows = "\n".join(song.getQueueRow() for song in self.songs[:15])
+        desc = self.rows
+        if (remSongs := self.count - len(self.songs[:15])) > 0:
             desc += f"\n...and other {remSongs} songs."
+        if self.pages is not None:
+            desc += "\n*still adding songs...*"
+        elif self.failed:
+            desc += f"\nAdded {self.count} songs, the rest of the playlist couldn't be loaded."
+        if self.pages is None and self.skipped:
+            desc += f"\nSkipped {len(self.skipped)} unavailable videos: " + ", ".join(
+                f"``{title}``" for title in self.skipped[:5]
+            ) + ("..." if len(self.skipped) > 5 else "")
         embed = Embed(
             description=desc,
             colour=Color.blue()
@@ -274,126 +348,169 @@ class SongAddedData:
 
 
 class NodePseudoFactory:
+    # youtube playlists are listed in chunks growing from PLAYLIST_FIRST_CHUNK entries up to PLAYLIST_MAX_CHUNK
+    PLAYLIST_FIRST_CHUNK = 20
+    PLAYLIST_MAX_CHUNK = 400
+
     def __init__(self, guildContext):
         self.guildContext: "GuildVoiceContext" = guildContext
 
     def interpretRequest(self, link, requester):
         # DONE check for valid link
-        cleanLink = re.findall(r'(?:https?://)?(?:[-\w.]|(?:%[\da-fA-F]{2}))+', link)[0]
-        if YoutubeAudioNode.isYoutubeLink(cleanLink):
-            mediaType, link = YoutubeAudioNode.parseYoutubeURL(link)
+        request = classifyRequest(link)
+        mediaType = request.mediaType
+        if request.provider == Provider.Youtube:
             match mediaType:
                 case MediaType.Video:
+                    link = f"https://youtu.be/{request.id}"
                     # DONE validate video: getInfo returns InvalidLinkException!
-                    info = YoutubeAudioNode.getInfo(link, self.guildContext.YDL_OPTIONS_FOR_AUDIO)
-                    self.guildContext.queue.put(node := YoutubeAudioNode(
-                        link, requester, self.guildContext,
+                    with self.guildContext.span("extract_info"):
+                        info = YoutubeAudioNode.getInfo(link, self.guildContext)
+                    trimmed = self.guildContext.cogMain.streamCache.putInfo(request.id, info)
+                    node = YoutubeAudioNode(
+                        link, requester.id,
                         duration=info["duration"], title=info["title"], uploader=info["uploader"],
-                        thumbnailUrl=info["thumbnails"][-1]["url"]
-                    ))
+                        thumbnailUrl=trimmed["thumbnail"]  # the last thumbnail, or "thumbnail" when there's no list
+                    )
                     return SongAddedData(node)
 
                 case MediaType.Playlist:
-                    info = YoutubeAudioNode.getInfoPlaylist(link, self.guildContext.YDL_OPTIONS_PLAYLIST)
-
-                    # DONE validate videos: if duration is None then the video wouldn't play!
-                    songsAdded = []
-                    for entry in info["entries"]:
-                        if entry.get("duration", None) is None:
-                            # TODO tell skipped videos
-                            continue
-                        self.guildContext.queue.put(node := YoutubeAudioNode(
-                            entry["url"], requester, self.guildContext,
-                            duration=entry["duration"], title=entry["title"], uploader=entry["uploader"],
-                            thumbnailUrl=entry["thumbnails"][-1]["url"]
-                        ))
-                        songsAdded.append(node)
-                    return SongAddedData(songsAdded)
-        elif SpotifyAudioNode.isSpotifyLink(cleanLink):
-            mediaType, spotify_id = SpotifyAudioNode.parseSpotifyURL(link)
-            if mediaType is None or spotify_id is None:
-                InvalidLinkException()
+                    link = f"https://youtube.com/playlist?list={request.id}"
+                    skipped = []
+                    chunks = self.iterYoutubePlaylist(link, request.startIndex or 1, requester, skipped)
+                    # returns as soon as a chunk has something playable, the rest is added like spotify pages
+                    songsAdded = next((nodes for nodes in chunks if nodes), [])
+                    return SongAddedData(songsAdded, pages=chunks, skipped=skipped)
+        elif request.provider == Provider.Spotify:
+            spotify_id = request.id
             if mediaType == MediaType.Song:
-                track = self.guildContext.cogMain.spotifyClient.track(track_id=spotify_id)
-                self.guildContext.queue.put(node := SpotifyAudioNode(
-                    f"open.spotify.com/track/{track['id']}", requester, self.guildContext,
-                    duration=round(track["duration_ms"] / 1000), title=track["name"],
-                    uploader=track["artists"][0]["name"],
-                    thumbnailUrl=track["album"]["images"][0]["url"], albumName=track['album']['name']
-                ))
-                return SongAddedData(node)
+                with self.guildContext.span("spotify_api"):
+                    track = self.guildContext.cogMain.spotifyClient.track(track_id=spotify_id)
+                return SongAddedData(self.makeSpotifyNode(track, requester))
             elif mediaType == MediaType.Album:
-                album_tracks_response = self.guildContext.cogMain.spotifyClient.album_tracks(album_id=spotify_id)
-                album_response = self.guildContext.cogMain.spotifyClient.album(album_id=spotify_id)
+                with self.guildContext.span("spotify_api"):
+                    album_response = self.guildContext.cogMain.spotifyClient.album(album_id=spotify_id)
                 image = album_response["images"][0]["url"]
-                album_items = album_tracks_response['items']
-                addedNodes = []
-                for item in album_items:
-                    track = item
-                    self.guildContext.queue.put(node := SpotifyAudioNode(
-                        f"open.spotify.com/track/{track['id']}", requester, self.guildContext,
-                        duration=round(track["duration_ms"] / 1000), title=track["name"],
-                        uploader=track["artists"][0]["name"],
-                        thumbnailUrl=image, albumName=album_response['name']
-                    ))
-                    addedNodes.append(node)
-                return SongAddedData(addedNodes, image)
+                makeNodes = lambda page: [
+                    self.makeSpotifyNode(track, requester, image, album_response['name'])
+                    for track in page['items']
+                ]
+                firstPage = album_response['tracks']
+                return SongAddedData(makeNodes(firstPage), image, self.iterSpotifyPages(firstPage, makeNodes))
             elif mediaType == MediaType.Playlist:
-                playlist_response = self.guildContext.cogMain.spotifyClient.playlist(playlist_id=spotify_id)
+                with self.guildContext.span("spotify_api"):
+                    playlist_response = self.guildContext.cogMain.spotifyClient.playlist(playlist_id=spotify_id)
                 image = playlist_response["images"][0]["url"]
-                playlist_items = playlist_response['tracks']['items']
-                addedNodes = []
-                for item in playlist_items:
-                    track = item.get("track", None)
-                    if track is None:
-                        continue
-                    self.guildContext.queue.put(node := SpotifyAudioNode(
-                        f"open.spotify.com/track/{track['id']}", requester, self.guildContext,
-                        duration=round(track["duration_ms"] / 1000), title=track["name"],
-                        uploader=track["artists"][0]["name"],
-                        thumbnailUrl=track["album"]["images"][0]["url"], albumName=track['album']['name']
-                    ))
-                    addedNodes.append(node)
-                return SongAddedData(addedNodes, image=image)
+                makeNodes = lambda page: [
+                    self.makeSpotifyNode(item["track"], requester)
+                    for item in page['items'] if item.get("track", None) is not None and item["track"]["id"]
+                ]
+                firstPage = playlist_response['tracks']
+                return SongAddedData(makeNodes(firstPage), image=image,
+                                     pages=self.iterSpotifyPages(firstPage, makeNodes))
             elif mediaType == MediaType.Artist:
-                artist_response = self.guildContext.cogMain.spotifyClient.artist_top_tracks(artist_id=spotify_id)
-                artist = self.guildContext.cogMain.spotifyClient.artist(artist_id=spotify_id)
-                addedNodes = []
-                for track in artist_response['tracks']:
-                    self.guildContext.queue.put(node := SpotifyAudioNode(
-                        f"open.spotify.com/track/{track['id']}", requester, self.guildContext,
-                        duration=round(track["duration_ms"] / 1000), title=track["name"],
-                        uploader=track["artists"][0]["name"],
-                        thumbnailUrl=track["album"]["images"][0]["url"], albumName=track['album']['name']
-                    ))
-                    addedNodes.append(node)
+                with self.guildContext.span("spotify_api"):
+                    artist_response = self.guildContext.cogMain.spotifyClient.artist_top_tracks(artist_id=spotify_id)
+                    artist = self.guildContext.cogMain.spotifyClient.artist(artist_id=spotify_id)
+                addedNodes = [self.makeSpotifyNode(track, requester) for track in artist_response['tracks']]
                 return SongAddedData(addedNodes, image=artist["images"][0]["url"])
-        elif not isUrlValid(link):  # if text -> yt
-            info = YoutubeAudioNode.searchYTFirstResult(link, self.guildContext.YDL_OPTIONS_FOR_AUDIO)
-            self.guildContext.queue.put(node := YoutubeAudioNode(
-                info["original_url"], requester, self.guildContext,
-                duration=info["duration"], title=info["title"], uploader=info["uploader"],
-                thumbnailUrl=info["thumbnails"][-1]["url"]
-            ))
+        elif request.provider == Provider.Search:  # if text -> yt
+            searchCache: SearchCache = self.guildContext.cogMain.searchCache
+            result = searchCache.getResult(link)
+            if result is None:
+                with self.guildContext.span("extract_info"):
+                    info = YoutubeAudioNode.searchYTFirstResult(link, self.guildContext)
+                if info.get("id", None) is not None:
+                    self.guildContext.cogMain.streamCache.putInfo(info["id"], info)  # the search resolved it already
+                result = searchCache.putResult(link, info)
+            node = YoutubeAudioNode(
+                result["link"], requester.id,
+                duration=result["duration"], title=result["title"], uploader=result["uploader"],
+                thumbnailUrl=result["thumbnail"]
+            )
             return SongAddedData(node)
         raise InvalidLinkException()  # provider not available
 
+    def makeSpotifyNode(self, track: dict, requester: User, thumbnailUrl: Optional[str] = None,
+                        albumName: Optional[str] = None) -> "SpotifyAudioNode":
+        return SpotifyAudioNode(
+            track['id'], requester.id,
+            duration=round(track["duration_ms"] / 1000), title=track["name"],
+            uploader=track["artists"][0]["name"],
+            thumbnailUrl=thumbnailUrl or track["album"]["images"][0]["url"],
+            albumName=albumName or track['album']['name']
+        )
+
+    def iterYoutubePlaylist(self, link: str, startIndex: int, requester: User, skipped: list[str]) \
+            -> Iterator[list[AudioNode]]:
+        # every call lists the playlist from the top again up to the end of the chunk, so chunks double in size to
+        # keep the pages youtube is asked for within about three times those of a single listing
+        start, size = startIndex, self.PLAYLIST_FIRST_CHUNK
+        while True:
+            end = start + size - 1
+            try:
+                with self.guildContext.span("extract_info"):
+                    info = YoutubeAudioNode.getInfoPlaylist(
+                        link, self.guildContext, {"playlist_items": f"{start}-{end}", "lazy_playlist": True}
+                    )
+            except (InvalidLinkException, ExtractionTimeoutException) as e:
+                if start == startIndex:
+                    raise
+                self.guildContext.logger.warning(f"stopped listing {link} at {start}: {e!r}")
+                return
+
+            # DONE validate videos: if duration is None then the video wouldn't play!
+            entries = info["entries"]
+            nodes = []
+            for entry in entries:
+                if entry.get("duration", None) is None:
+                    skipped.append(entry.get("title", None) or entry.get("id", None) or "?")
+                    continue
+                nodes.append(YoutubeAudioNode(
+                    entry["url"], requester.id,
+                    duration=entry["duration"], title=entry["title"], uploader=entry["uploader"],
+                    thumbnailUrl=entry["thumbnail"]
+                ))
+            yield nodes
+
+            playlistCount = info.get("playlist_count", None)
+            lastIndex = max((entry["playlist_index"] for entry in entries if entry.get("playlist_index", None)),
+                            default=start + len(entries) - 1)
+            if not entries or (end >= playlistCount if playlistCount is not None else lastIndex < end):
+                return
+            start, size = end + 1, min(size * 2, self.PLAYLIST_MAX_CHUNK)
+
+    def iterSpotifyPages(self, page: dict, makeNodes: Callable[[dict], list[AudioNode]]) \
+            -> Optional[Iterator[list[AudioNode]]]:
+        if page.get("next", None) is None:
+            return None
+
+        def pages():
+            nextPage = page
+            while True:
+                with self.guildContext.span("spotify_api"):
+                    nextPage = self.guildContext.cogMain.spotifyClient.next(nextPage)
+                if nextPage is None:
+                    return
+                yield makeNodes(nextPage)
+
+        return pages()
+
 
 class LoggerOutputs:
-    def __init__(self):
-        pass
+    # Writes to the "viktor.music" logger, with a child logger per guild. yt-dlp logs to "viktor.music.yt_dlp"
+    # through the extraction service.
+    def __init__(self, guildId: Optional[int] = None):
+        self.logger = logging.getLogger("viktor.music" if guildId is None else f"viktor.music.{guildId}")
 
     def error(self, msg):
-        pass
-        # print("Captured Error: " + msg)
+        self.logger.error(msg)
 
     def warning(self, msg):
-        pass
-        # print("Captured Warning: " + msg)
+        self.logger.warning(msg)
 
     def debug(self, msg):
-        pass
-        # print("Captured Log: " + msg)
+        self.logger.debug(msg)
 
 
 class EmptyLoggerOutputs:
@@ -407,101 +524,532 @@ class EmptyLoggerOutputs:
 
 
 class CommandQueueHandler:
+    # Per guild actor: every state change (play, skip, stop, pause, loop, queue edits) is queued here and applied
+    # one at a time by a single task, so commands never interleave and no thread or lock is needed.
     def __init__(self, guildContext):
-        self.commandQueue = Queue()
+        self.commandQueue: asyncio.Queue = asyncio.Queue()
         self.guildContext: "GuildVoiceContext" = guildContext
+        self.task: Optional[asyncio.Task] = None
+        # from the moment a command is queued until its turn comes
+        self.latency: Histogram = guildContext.cogMain.metrics.histogram("command", guildContext.guild.id)
+
+    def submit(self, func: Callable[..., Awaitable], *args, **kwargs) -> asyncio.Future:
+        self.guildContext.lastActiveAt = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(self.onCommandDone)
+        self.commandQueue.put_nowait((time.perf_counter(), func, args, kwargs, future))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.commandLoop())
+        return future
+
+    async def commandLoop(self):
+        while True:
+            enqueuedAt, func, args, kwargs, future = await self.commandQueue.get()
+            self.latency.observe(time.perf_counter() - enqueuedAt)
+            if future.cancelled():
+                continue
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                if self.task is not asyncio.current_task():
+                    raise  # the handler itself is closing, close() already let go of this task
+                future.cancel()  # an extraction it waited on was cancelled, e.g. by /stop
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
 
-        self.inLoop = False
-        self.commandLoopLock = threading.Lock()
-        # TODO make play also part of the command handler
-
-    def wakeUpCommandLoop(self):
-        self.commandLoopLock.acquire()
-        if not self.inLoop:
-            threading.Thread(target=self.commandLoop).start()
-        self.commandLoopLock.release()
-
-    def commandLoop(self):
-        self.commandLoopLock.acquire()
-        self.inLoop = True
-        while not self.commandQueue.empty():
-            self.commandLoopLock.release()
-            func, args, kwargs = self.commandQueue.get()
-            func(*args, **kwargs)
-            self.commandLoopLock.acquire()
-        self.inLoop = False
-        self.commandLoopLock.release()
+    def onCommandDone(self, future: asyncio.Future):
+        # nobody awaits commands like the end of song "play", so their errors are logged here
+        if not future.cancelled() and future.exception() is not None:
+            self.guildContext.logger.error(f"command failed: {future.exception()!r}")
 
-    def skip(self, count=1):
-        self.commandQueue.put((self.__skip, [], {"count": count}))
-        self.wakeUpCommandLoop()
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
 
-    def __skip(self, count=1):
-        with self.guildContext.lock:
-            if count > 1:
-                for _ in range(0, count - 1):
-                    self.guildContext.queue.get()
-            if count >= 1:
-                self.guildContext.getVoiceClient().stop()
+    def play(self):
+        return self.submit(self.__play)
 
-    def stop(self):
-        self.commandQueue.put((self.__stop, [], {}))
-        self.wakeUpCommandLoop()
+    async def __play(self):
+        vClient = self.guildContext.getVoiceClient()
+        if vClient is None or vClient.is_playing() or vClient.is_paused():
+            return
+        await self.guildContext.playNext()
+
+    def enqueue(self, nodes: list[AudioNode]):
+        return self.submit(self.__enqueue, nodes)
+
+    async def __enqueue(self, nodes: list[AudioNode]):
+        self.guildContext.queue.extend(nodes)
+        self.guildContext.preResolver.schedule()
 
-    def __stop(self):
-        with self.guildContext.lock:
-            with self.guildContext.queue.mutex:
-                self.guildContext.queue.queue.clear()
+    def skip(self, count=1):
+        return self.submit(self.__skip, count=count)
+
+    async def __skip(self, count=1):
+        if count > 1:
+            self.guildContext.queue.skipTo(count - 1)
+        if count >= 1:
             self.guildContext.getVoiceClient().stop()
 
+    def stop(self):
+        return self.submit(self.__stop)
+
+    async def __stop(self):
+        guildContext = self.guildContext
+        guildContext.queue.clear()
+        guildContext.preResolver.invalidate()
+        # with a loop mode on the song playing would be picked up again by its "after", so it is let go of here
+        guildContext.transitionScheduler.ignorePending()
+        guildContext.nodePlaying = None
+        guildContext.resumeAt = None
+        voiceClient = guildContext.getVoiceClient()
+        if voiceClient is not None:
+            voiceClient.stop()
+        await guildContext.playNext()  # nothing left, it only tidies up as when the queue ends
+
     def pause(self):
-        self.commandQueue.put((self.__pause, [], {}))
-        self.wakeUpCommandLoop()
-
-    def __pause(self):
-        with self.guildContext.lock:
-            vClient = self.guildContext.getVoiceClient()
-            if vClient.is_paused():
-                vClient.resume()
-            else:
-                vClient.pause()
+        return self.submit(self.__pause)
+
+    async def __pause(self) -> bool:
+        vClient = self.guildContext.getVoiceClient()
+        if vClient.is_paused():
+            vClient.resume()
+            self.guildContext.onResumed()
+        else:
+            vClient.pause()
+            self.guildContext.onPaused()
+        return vClient.is_paused()
 
     def setLoopMode(self, loopMode: LoopMode):
-        self.commandQueue.put((self.__setLoopMode, [], {"loopMode": loopMode}))
-        self.wakeUpCommandLoop()
+        return self.submit(self.__setLoopMode, loopMode=loopMode)
 
-    def __setLoopMode(self, loopMode: LoopMode):
+    async def __setLoopMode(self, loopMode: LoopMode):
         self.guildContext.loopMode = loopMode
+        self.guildContext.journal.setLoopMode(loopMode.value)
+
+    def shuffle(self):
+        return self.submit(self.__shuffle)
+
+    async def __shuffle(self):
+        self.guildContext.queue.shuffle()
+        self.guildContext.preResolver.schedule()
+
+    def remove(self, position: int):
+        return self.submit(self.__remove, position)
+
+    async def __remove(self, position: int) -> AudioNode:
+        node = self.guildContext.queue.remove(position)
+        self.guildContext.preResolver.schedule()
+        return node
+
+    def move(self, source: int, destination: int):
+        return self.submit(self.__move, source, destination)
+
+    def setVolume(self, volume: int):
+        return self.submit(self.__setVolume, volume)
+
+    async def __setVolume(self, volume: int):
+        self.guildContext.volume = volume
+        self.guildContext.journal.setVolume(volume)
+        await self.__restartPlaying()
+
+    def seek(self, position: Optional[float], delta: float = 0.0):
+        # to `position`, or `delta` seconds from where the song is when the command runs
+        return self.submit(self.__seek, position, delta)
+
+    async def __seek(self, position: Optional[float], delta: float = 0.0) -> Optional[float]:
+        # returns where the song continues from, None when nothing is playing
+        node = self.guildContext.nodePlaying
+        if node is None:
+            return None
+        position = (self.guildContext.getPosition() if position is None else position) + delta
+        if node.getDuration() > 0:
+            position = min(position, node.getDuration() - 1)
+        position = max(0.0, position)
+        with self.guildContext.span("seek"):
+            await self.__restartPlaying(position)
+        return position
+
+    async def __restartPlaying(self, position: Optional[float] = None):
+        # spawns ffmpeg again for the current song, on the stream it already had, from `position` (where the song is
+        # by default) so a seek or the current filters take effect. the old source's "after" is ignored
+        guildContext = self.guildContext
+        voiceClient = guildContext.getVoiceClient()
+        if guildContext.nodePlaying is None or voiceClient is None:
+            return
+        paused = voiceClient.is_paused()
+        node, stream = guildContext.nodePlaying, guildContext.streamPlaying
+        if position is None:
+            position = guildContext.getPosition()
+        guildContext.transitionScheduler.ignorePending()
+        voiceClient.stop()
+        guildContext.requeuePlaying()
+        guildContext.resumeAt = (node, position, stream)
+        await guildContext.playNext()
+        if paused and voiceClient.is_playing():
+            voiceClient.pause()
+            guildContext.onPaused()
+
+    def disconnect(self):
+        return self.submit(self.__disconnect)
+
+    async def __disconnect(self):
+        # leaves voice, a song that was still on (paused) goes back to the front of the queue to be played again
+        guildContext = self.guildContext
+        guildContext.transitionScheduler.ignorePending()
+        if guildContext.nodePlaying is not None:
+            # continues where it was, once something is played again
+            guildContext.resumeAt = (guildContext.nodePlaying, guildContext.getPosition(), None)
+        guildContext.requeuePlaying()
+        guildContext.preResolver.invalidate()
+        guildContext.nowPlaying.show(None)
+        voiceClient = guildContext.getVoiceClient()
+        if voiceClient is not None:
+            await voiceClient.disconnect(force=True)
+
+    async def __move(self, source: int, destination: int):
+        self.guildContext.queue.move(source, destination)
+        self.guildContext.preResolver.schedule()
+
+
+class QueuePreResolver:
+    # Resolves the sources of the next songs in the queue while the current one plays, so that
+    # playNext usually finds the source already waiting for it.
+    MAX_SOURCE_AGE = 60 * 60  # resolved sources older than this are re-resolved when played
+
+    def __init__(self, guildContext: "GuildVoiceContext", depth: int):
+        self.guildContext: "GuildVoiceContext" = guildContext
+        self.depth = depth
+        self.resolved: dict[AudioNode, tuple[dict, float]] = {}  # node -> (stream, resolved at)
+        self.pending: dict[AudioNode, asyncio.Future] = {}
+
+    def setDepth(self, depth: int):
+        self.depth = depth
+        self.schedule()
+
+    def schedule(self):
+        upcoming = self.guildContext.queue.peek(self.depth)
+        self.prune(upcoming)
+        for node in upcoming:
+            if node in self.resolved or node in self.pending:
+                continue
+            future = asyncio.ensure_future(
+                self.guildContext.cogMain.extractor.runBackground(node.getStream, self.guildContext)
+            )
+            future.add_done_callback(functools.partial(self.onResolved, node))
+            self.pending[node] = future
+
+    def onResolved(self, node: AudioNode, future: asyncio.Future):
+        failed = future.cancelled() or future.exception() is not None
+        if self.pending.get(node, None) is not future:
+            return  # invalidated while it was resolving
+        del self.pending[node]
+        if failed:
+            return
+        self.resolved[node] = (future.result(), time.monotonic())
+
+    async def take(self, node: AudioNode) -> Optional[dict]:
+        stream, resolvedAt = self.resolved.pop(node, (None, 0))
+        if stream is not None and time.monotonic() - resolvedAt < self.MAX_SOURCE_AGE:
+            return stream
+        future = self.pending.pop(node, None)
+        if future is not None:
+            try:
+                # shielded, so the resolve being cancelled can be told apart from whoever waits on it being cancelled
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    future.cancel()
+                    raise
+                return None
+            except Exception:
+                return None
+        return None
+
+    def prune(self, upcoming: list[AudioNode]):
+        # drops what was resolved for songs that were skipped or removed from the look-ahead window
+        for node in [node for node in self.pending if node not in upcoming]:
+            self.pending.pop(node).cancel()
+        for node in [node for node in self.resolved if node not in upcoming]:
+            del self.resolved[node]
+
+    def invalidate(self):
+        self.prune([])
+
+
+class TransitionScheduler:
+    # The voice client calls "after" from its audio thread once a song ends; this hands that back to the event loop
+    # so the next song starts right away, and measures the silence between the two songs.
+    GAP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1, 2, 5, 10, 30)
+
+    def __init__(self, guildContext: "GuildVoiceContext"):
+        self.guildContext: "GuildVoiceContext" = guildContext
+        self.loop = asyncio.get_running_loop()
+        self.token = 0  # callbacks of songs that were replaced meanwhile carry an old token and are ignored
+        self.trackEndedAt: Optional[float] = None
+        self.gaps: Histogram = guildContext.cogMain.metrics.histogram(
+            "transition_gap", guildContext.guild.id, self.GAP_BUCKETS
+        )
+
+    def makeAfterCallback(self) -> Callable[[Optional[Exception]], None]:
+        self.token += 1
+        token = self.token
+
+        def after(error: Optional[Exception]):
+            endedAt = time.perf_counter()
+            self.loop.call_soon_threadsafe(self.onTrackEnd, token, endedAt, error)
+
+        return after
+
+    def onTrackEnd(self, token: int, endedAt: float, error: Optional[Exception]):
+        if token != self.token:
+            return
+        if error is not None:
+            self.guildContext.logger.error(f"playback error: {error!r}")
+        self.trackEndedAt = endedAt
+        self.guildContext.commandHandler.play()
+
+    def ignorePending(self):
+        # the song being played is about to be stopped on purpose, its "after" shouldn't start the next one
+        self.token += 1
+        self.trackEndedAt = None
+
+    def onTrackStart(self):
+        if self.trackEndedAt is not None:
+            self.gaps.observe(time.perf_counter() - self.trackEndedAt)
+            self.trackEndedAt = None
+
+    def onQueueEnded(self):
+        self.trackEndedAt = None  # the next song will come from a new /play, that wait isn't a transition gap
+
+
+class NowPlayingPresenter:
+    # Keeps a single now playing message per guild and edits it on song changes instead of deleting it and sending
+    # a new one. Changes coming faster than DEBOUNCE (skip bursts, short songs) are folded into one update of the
+    # latest state, and a 429 pauses updates for as long as discord's Retry-After says.
+    # `legacyRestCalls` counts what deleting and re-sending would have cost, for comparison with `restCalls`.
+    DEBOUNCE = 1.5  # seconds
+
+    def __init__(self, guildContext: "GuildVoiceContext"):
+        self.guildContext: "GuildVoiceContext" = guildContext
+        self.message: Optional[Message] = None
+        self.shownNode: Optional[AudioNode] = None
+        self.wantedNode: Optional[AudioNode] = None
+        self.task: Optional[asyncio.Task] = None
+        self.lastUpdateAt = 0.0
+        self.blockedUntil = 0.0
+        self.restCalls = 0
+        self.legacyRestCalls = 0
+        self.legacyHasMessage = False
+        self.rateLimited = 0
+
+    def show(self, node: Optional[AudioNode]):
+        # None removes the message, once the queue is over
+        self.legacyRestCalls += int(self.legacyHasMessage) + int(node is not None)
+        self.legacyHasMessage = node is not None
+        self.wantedNode = node
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.updateLoop())
+
+    async def updateLoop(self):
+        while self.wantedNode is not self.shownNode or self.isInWrongChannel():
+            now = time.monotonic()
+            await asyncio.sleep(max(0.0, self.lastUpdateAt + self.DEBOUNCE - now, self.blockedUntil - now))
+            node = self.wantedNode
+            try:
+                await self.update(node)
+            except HTTPException as e:
+                if e.status != 429:
+                    self.guildContext.logger.warning(f"now playing message update failed: {e!r}")
+                    self.shownNode = node  # not worth retrying
+                    return
+                self.rateLimited += 1
+                self.blockedUntil = time.monotonic() + self.getRetryAfter(e)
+            except Exception as e:
+                # the loop goes on, or now playing updates would stop for this guild until the next song
+                self.guildContext.logger.error(f"now playing message update failed: {e!r}")
+                self.shownNode = node
+            finally:
+                self.lastUpdateAt = time.monotonic()
+
+    @staticmethod
+    def getRetryAfter(error: HTTPException) -> float:
+        headers = getattr(error.response, "headers", None) or {}
+        try:
+            return float(headers.get("Retry-After", None) or headers.get("X-RateLimit-Reset-After", None) or 5)
+        except ValueError:
+            return 5.0
+
+    def isInWrongChannel(self) -> bool:
+        replyChannel = self.guildContext.replyChannel
+        return self.message is not None and replyChannel is not None and self.message.channel.id != replyChannel.id
+
+    async def update(self, node: Optional[AudioNode]):
+        if self.message is not None and (node is None or self.isInWrongChannel()):
+            message, self.message = self.message, None
+            self.restCalls += 1
+            try:
+                with self.guildContext.span("discord_rest"):
+                    await message.delete()
+            except NotFound:
+                pass
+        if node is not None:
+            if self.message is not None:
+                self.restCalls += 1
+                try:
+                    with self.guildContext.span("discord_rest"):
+                        await self.message.edit(embed=node.makeEmbed())
+                except NotFound:
+                    self.message = None  # deleted by someone, sent again below
+            if self.message is None:
+                if self.guildContext.replyChannel is None:
+                    self.shownNode = node  # nowhere to send it, e.g. a restored guild nobody wrote to yet
+                    return
+                self.restCalls += 1
+                with self.guildContext.span("discord_rest"):
+                    self.message = await self.guildContext.replyChannel.send(embed=node.makeEmbed())
+        self.shownNode = node
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def getStats(self) -> dict:
+        return {
+            "restCalls": self.restCalls,
+            "restCallsSaved": max(0, self.legacyRestCalls - self.restCalls),
+            "rateLimited": self.rateLimited
+        }
+
+
+class InactivityManager:
+    # Looks at every guild now and then. Voice is left once nothing was heard for `disconnectAfter` seconds (paused,
+    # queue over or everybody left), and a context idle for `hibernateAfter` seconds is dropped: what is worth
+    # keeping goes to its queue journal, or stays here in the journal's compact form when persistence is off,
+    # and is put back when the guild is used again. None for either turns that step off.
+    CHECK_INTERVAL = 30  # seconds
+
+    def __init__(self, cogMain: "MusicCog", disconnectAfter: Optional[float], hibernateAfter: Optional[float]):
+        self.cogMain: "MusicCog" = cogMain
+        self.disconnectAfter = disconnectAfter
+        self.hibernateAfter = hibernateAfter
+        # guild id -> its state like QueueJournal.load returns it, None when it is in the journal on disk
+        self.hibernated: dict[int, Optional[dict]] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.disconnects = 0
+        self.hibernations = 0
+
+    def start(self):
+        if self.task is None and (self.disconnectAfter is not None or self.hibernateAfter is not None):
+            self.task = asyncio.create_task(self.checkLoop())
+
+    async def checkLoop(self):
+        while True:
+            await asyncio.sleep(self.CHECK_INTERVAL)
+            try:
+                await self.check()
+            except Exception as e:
+                logging.getLogger("viktor.music").error(f"inactivity check failed: {e!r}")
+
+    async def check(self):
+        now = time.monotonic()
+        for guildContext in list(self.cogMain.guildContexts.values()):
+            if guildContext.isActive():
+                guildContext.lastActiveAt = now
+                continue
+            idleFor = now - guildContext.lastActiveAt
+            if guildContext.isConnected():
+                if self.disconnectAfter is not None and idleFor >= self.disconnectAfter:
+                    await self.disconnect(guildContext)
+            elif self.hibernateAfter is not None and idleFor >= self.hibernateAfter \
+                    and guildContext.commandHandler.commandQueue.empty():
+                self.hibernate(guildContext)
+
+    async def disconnect(self, guildContext: "GuildVoiceContext"):
+        self.disconnects += 1
+        await guildContext.disconnect()
+        guildContext.lastActiveAt = time.monotonic()  # hibernation counts from here
+        if guildContext.replyChannel is not None:
+            try:
+                await guildContext.replyChannel.send(embed=Embed(
+                    description="Left the voice channel since nothing was playing.", colour=Color.blue()
+                ))
+            except HTTPException:
+                pass
+
+    def hibernate(self, guildContext: "GuildVoiceContext"):
+        guildId = guildContext.guild.id
+        state = guildContext.getPersistentState()
+        guildContext.journal.snapshot()  # the files go away if the queue is empty
+        if state["queue"] and isinstance(guildContext.journal, QueueJournal):
+            self.hibernated[guildId] = None
+        elif state["queue"] or state["loopMode"] != LoopMode.Disabled.value \
+                or state["lookahead"] != self.cogMain.lookaheadDepth \
+                or state["volume"] != GuildVoiceContext.DEFAULT_VOLUME:
+            self.hibernated[guildId] = state  # small without a queue, or persistence is off
+        guildContext.close()
+        del self.cogMain.guildContexts[guildId]
+        self.hibernations += 1
+
+    def wake(self, guildContext: "GuildVoiceContext"):
+        # called for every new context, gives it back what it had before hibernating
+        if guildContext.guild.id not in self.hibernated:
+            return
+        state = self.hibernated.pop(guildContext.guild.id)
+        if state is None:
+            self.cogMain.journalWriter.submit(lambda: None).result()  # the snapshot taken when hibernating is written
+            state = QueueJournal.load(self.cogMain.queueDirectory, guildContext.guild.id)
+        if state is not None:
+            guildContext.restoreState(state, resume=False)
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
 
 
 class GuildVoiceContext:
+    STREAM_MIN_VALIDITY = 60  # seconds a stream url should still be valid for to be opened again for a seek
+    DEFAULT_VOLUME = 100
+    LOUDNESS_TOLERANCE = 1.0  # dB, smaller corrections are skipped at the default volume to keep opus remuxed
+
     def __init__(self, guild, cogMain: "MusicCog"):
         self.guild: Guild = guild
         self.cogMain: "MusicCog" = cogMain
         self.replyChannel: Optional[TextChannel] = None
-        self.queue = Queue()
+        self.queue: TrackQueue[AudioNode] = TrackQueue()
+        self.queuePages = QueuePageRenderer(self.queue, AudioNode.getQueueRow)
         self.nodePlaying: Optional[AudioNode] = None
+        self.nodeStartedAt: Optional[float] = None  # wall clock time the playing song would have started at
+        self.pausedAt: Optional[float] = None  # wall clock time it was paused at, the position stands still meanwhile
+        self.streamPlaying: Optional[dict] = None  # what the playing song was resolved to, reused to seek in it
+        # a song to start somewhere else than at its beginning: (node, position, stream to reuse if still valid)
+        self.resumeAt: Optional[tuple[AudioNode, float, Optional[dict]]] = None
+        self.voiceChannelId: Optional[int] = None
+        self.volume = self.DEFAULT_VOLUME  # percent, applied by ffmpeg together with the loudness correction
+        self.lastActiveAt = time.monotonic()  # last command or moment something was heard, see InactivityManager
         self.loopMode: LoopMode = LoopMode.Disabled
-        self.lastNowPlayingMessage = None
+        self.ingestionGeneration = 0  # bumped on stop, so playlists still being added stop adding
+        self.journal = cogMain.makeJournal(self)
+        self.queue.observer = self.journal
 
         self.nodePseudoFactory = NodePseudoFactory(self)
         self.commandHandler = CommandQueueHandler(self)
-        self.lock = threading.Lock()
-
-        # TODO add autodisconnect after some other time of inactivity
-        # TODO add *functional* logger
-        # TODO fix sequential /play (probably result of put play in commandQueue)
-        self.logger = EmptyLoggerOutputs()  # DONE add logger
-        self.logger = LoggerOutputs()
-        self.YDL_OPTIONS_FOR_AUDIO = cogMain.YDL_OPTIONS_FOR_AUDIO.copy()
-        self.YDL_OPTIONS_FOR_AUDIO['logger'] = self.logger
-        self.YDL_OPTIONS_PLAYLIST = cogMain.YDL_OPTIONS_PLAYLIST.copy()
-        self.YDL_OPTIONS_PLAYLIST['logger'] = self.logger
+        self.preResolver = QueuePreResolver(self, cogMain.lookaheadDepth)
+        self.transitionScheduler = TransitionScheduler(self)
+        self.nowPlaying = NowPlayingPresenter(self)
+
+        self.logger = LoggerOutputs(guild.id)
         self.ffmpegExePath = cogMain.ffmpegExePath
         self.FFMPEG_OPTIONS = cogMain.FFMPEG_OPTIONS
 
     def calculateQueueDuration(self):  # in seconds
-        return sum([node.getDuration() for node in self.queue.queue])
+        return self.queue.totalDuration
 
     def hasNextNode(self):
         return (
@@ -510,85 +1058,298 @@ class GuildVoiceContext:
                 self.loopMode in [LoopMode.Queue, LoopMode.Song] and self.nodePlaying is not None
         )
 
-    async def playNext(self):
-        with self.lock:
-            while self.hasNextNode():  # interpret as an if that can be repeated
-                if self.loopMode == LoopMode.Queue:
-                    self.queue.put(self.nodePlaying)
-                    self.nodePlaying: AudioNode = self.queue.get()
-                elif self.loopMode == LoopMode.Disabled:
-                    self.nodePlaying: AudioNode = self.queue.get()
-
-                # play audio and recursively call this function
-                # get source
-                try:
-                    audioSource = self.nodePlaying.getSource()
-                except InvalidLinkException:
-                    # TODO notify song was skipped
-                    continue
-
-                ffmpegAudioSource: AudioSource = FFmpegPCMAudio(
-                    executable=self.ffmpegExePath, source=audioSource, **self.FFMPEG_OPTIONS
-                )
-                self.getVoiceClient().play(
-                    ffmpegAudioSource, after=lambda e: self.playNext(),
-
-                )
-
-                await self.deletePreviousNowPlayingMessage()
-                await self.sendNowPlayingMessage()
-                return
+    def extractInfo(self, profile: str, url: str, params: Optional[dict] = None) -> Optional[dict]:
+        # blocking, called from the extraction threads
+        return self.cogMain.extractionService.extract(profile, url, params)
+
+    def span(self, stage: str):
+        # times a stage of a request or of playback into this guild's and the global histograms
+        return self.cogMain.metrics.span(stage, self.guild.id)
+
+    def rememberChannels(self):
+        voiceClient = self.getVoiceClient()
+        if voiceClient is not None and voiceClient.channel is not None:
+            self.voiceChannelId = voiceClient.channel.id
+        self.journal.setChannels(self.voiceChannelId, None if self.replyChannel is None else self.replyChannel.id)
+
+    def getPersistentState(self) -> dict:
+        # everything the queue journal snapshots, in the shape QueueJournal.load returns it
+        return {
+            "queue": [node.toRecord() for node in self.queue],
+            "playing": None if self.nodePlaying is None else self.nodePlaying.toRecord(),
+            "startedAt": self.nodeStartedAt,
+            "loopMode": self.loopMode.value,
+            "lookahead": self.preResolver.depth,
+            "volume": self.volume,
+            "voiceChannelId": self.voiceChannelId,
+            "replyChannelId": None if self.replyChannel is None else self.replyChannel.id
+        }
 
-            # if condition fails
-            await self.deletePreviousNowPlayingMessage()
+    def restoreState(self, state: dict, resume: bool) -> Optional[float]:
+        # puts back what the journal had, the song that was playing first. returns where that song should resume
+        nodes = [nodeFromRecord(record) for record in state["queue"]]
+        resumeAt = None
+        if state["playing"] is not None:
+            playing = nodeFromRecord(state["playing"])
+            startedAt = state["startedAt"] or 0.0
+            # the last sign of life is as close as it gets, time spent paused is counted as played
+            position = max(0.0, (state.get("lastAliveAt", None) or startedAt) - startedAt)
+            if position < playing.getDuration() - self.cogMain.RESUME_END_MARGIN:
+                nodes.insert(0, playing)
+                resumeAt = position
+                if resume:
+                    self.resumeAt = (playing, position, None)
+        self.queue.observer = None  # the snapshot below writes them once
+        self.queue.extend(nodes)
+        self.queue.observer = self.journal
+        self.loopMode = LoopMode(state["loopMode"])
+        self.preResolver.depth = state.get("lookahead", None) or self.preResolver.depth
+        self.volume = state.get("volume", self.volume)
+        self.voiceChannelId = state["voiceChannelId"]
+        if state["replyChannelId"] is not None:
+            self.replyChannel = self.guild.get_channel(state["replyChannelId"])
+        self.journal.snapshot()
+        return resumeAt
+
+    def requeuePlaying(self):
+        # the current song goes back to the front of the queue, nothing is playing afterwards
+        if self.nodePlaying is not None:
+            self.queue.put(self.nodePlaying)
+            self.queue.move(len(self.queue) - 1, 0)
             self.nodePlaying = None
+            self.setPlayingState(None, None)
+            self.journal.setPlaying(None, None)
+
+    def setPlayingState(self, stream: Optional[dict], startedAt: Optional[float]):
+        self.streamPlaying = stream
+        self.nodeStartedAt = startedAt
+        self.pausedAt = None
+
+    def getPosition(self) -> float:
+        # seconds into the current song
+        if self.nodeStartedAt is None:
+            return 0.0
+        return max(0.0, (self.pausedAt or time.time()) - self.nodeStartedAt)
+
+    def onPaused(self):
+        if self.nodeStartedAt is not None and self.pausedAt is None:
+            self.pausedAt = time.time()
+
+    def onResumed(self):
+        if self.nodeStartedAt is not None and self.pausedAt is not None:
+            self.nodeStartedAt += time.time() - self.pausedAt
+            self.pausedAt = None
+            self.journal.setPlaying(self.nodePlaying, round(self.nodeStartedAt, 1))
 
-    async def deletePreviousNowPlayingMessage(self):
-        if self.lastNowPlayingMessage is not None:
-            await self.lastNowPlayingMessage.delete()
-            self.lastNowPlayingMessage = None
-
-    async def sendNowPlayingMessage(self):
-        self.nodePlaying: AudioNode
-        self.lastNowPlayingMessage = await self.replyChannel.send(embed=self.nodePlaying.makeEmbed())
+    @staticmethod
+    def isStreamFresh(stream: dict) -> bool:
+        # whether a stream url resolved earlier can still be opened
+        if stream.get("local", False):
+            return os.path.exists(stream["url"])
+        expiry = StreamUrlCache.getUrlExpiry(stream["url"] or "")
+        return expiry is None or expiry - time.time() > GuildVoiceContext.STREAM_MIN_VALIDITY
+
+    def isConnected(self) -> bool:
+        voiceClient = self.getVoiceClient()
+        return voiceClient is not None and voiceClient.is_connected()
+
+    def isActive(self) -> bool:
+        # something is playing and somebody is there to hear it
+        voiceClient = self.getVoiceClient()
+        if voiceClient is None or not voiceClient.is_playing() or voiceClient.is_paused():
+            return False
+        channel = voiceClient.channel
+        if channel is None:
+            return True
+        # voice states are kept for everyone in the channel, channel.members only has the cached members and the
+        # lean gateway mode doesn't cache members that were already in voice when the bot started
+        botId = self.cogMain.client.user.id
+        for memberId in channel.voice_states:
+            member = self.guild.get_member(memberId)
+            if memberId != botId and (member is None or not member.bot):
+                return True
+        return False
+
+    def close(self):
+        # stops everything the context runs, before it is dropped
+        self.ingestionGeneration += 1
+        self.cogMain.extractor.cancel(self.guild.id)
+        self.preResolver.invalidate()
+        self.nowPlaying.close()
+        self.commandHandler.close()
+        self.journal.close()
+        self.cogMain.extractor.forget(self.guild.id)
+        self.cogMain.metrics.dropGuild(self.guild.id)
+
+    async def playNext(self):  # only called from the command handler, see CommandQueueHandler.play
+        startedAt = time.perf_counter()
+        while self.hasNextNode():  # interpret as an if that can be repeated
+            if self.loopMode == LoopMode.Queue and self.nodePlaying is not None:
+                self.queue.put(self.nodePlaying)
+            if self.loopMode != LoopMode.Song or self.nodePlaying is None:
+                self.nodePlaying: AudioNode = self.queue.get()
+            startAt, stream = 0.0, None
+            if self.resumeAt is not None:
+                if self.resumeAt[0] is self.nodePlaying:
+                    _, startAt, stream = self.resumeAt
+                self.resumeAt = None
+            restarted = stream is not None  # the same song again, after a seek
+            if stream is not None and not self.isStreamFresh(stream):
+                stream = None
+
+            # play audio and recursively call this function
+            # get source
+            try:
+                with self.span("get_stream"):
+                    if stream is None:
+                        stream = await self.preResolver.take(self.nodePlaying)
+                    if stream is None:
+                        stream = await self.cogMain.extractor.run(self.guild.id, self.nodePlaying.getStream, self)
+            except Exception as e:
+                # TODO notify song was skipped
+                self.logger.warning(f"skipped {self.nodePlaying.getLink()}, no stream: {e!r}")
+                self.nodePlaying = None  # dropped, even when looping, so the rest of the queue still plays
+                continue
+
+            with self.span("ffmpeg_spawn"):
+                ffmpegAudioSource: AudioSource = await self.makeAudioSource(stream, startAt)
+            self.getVoiceClient().play(ffmpegAudioSource, after=self.transitionScheduler.makeAfterCallback())
+            self.transitionScheduler.onTrackStart()
+            self.setPlayingState(stream, time.time() - startAt)
+            self.journal.setPlaying(self.nodePlaying, round(self.nodeStartedAt, 1))
+            self.cogMain.metrics.histogram("play_next", self.guild.id).observe(time.perf_counter() - startedAt)
+            if self.cogMain.audioCache is not None and not restarted:
+                self.cogMain.audioCache.recordPlay(stream)
+            if self.cogMain.loudness is not None:
+                self.cogMain.loudness.schedule(stream)
+
+            self.preResolver.schedule()
+            self.nowPlaying.show(self.nodePlaying)
+            return
+
+        # if condition fails
+        self.transitionScheduler.onQueueEnded()
+        self.nowPlaying.show(None)
+        self.nodePlaying = None
+        self.setPlayingState(None, None)
+        self.journal.setPlaying(None, None)
+
+    async def makeAudioSource(self, stream: dict, startAt: float = 0.0) -> AudioSource:
+        volumeFactor = self.getVolumeFactor(stream)
+        if self.cogMain.playbackMode == PlaybackMode.Opus:
+            # ffmpeg hands out opus packets directly: youtube's opus/webm streams are only remuxed and anything
+            # else is encoded inside ffmpeg, so nextcord doesn't have to encode pcm in python for every guild
+            try:
+                codec = stream.get("acodec", None)
+                bitrate = stream.get("abr", None)
+                if volumeFactor != 1:
+                    codec = None  # a filtered stream can't be remuxed, it's encoded again (still by ffmpeg)
+                elif codec in (None, "none"):
+                    codec, bitrate = await FFmpegOpusAudio.probe(
+                        stream["url"], method="fallback", executable=self.ffmpegExePath
+                    )
+                return FFmpegOpusAudio(
+                    stream["url"], bitrate=min(round(bitrate or 128), 512), codec=codec,
+                    executable=self.ffmpegExePath, **self.getFfmpegOptions(stream, startAt, volumeFactor)
+                )
+            except Exception as e:
+                self.logger.warning(f"opus passthrough unavailable, falling back to pcm: {e!r}")
+        return FFmpegPCMAudio(executable=self.ffmpegExePath, source=stream["url"],
+                              **self.getFfmpegOptions(stream, startAt, volumeFactor))
+
+    def getFfmpegOptions(self, stream: dict, startAt: float = 0.0, volumeFactor: float = 1.0) -> dict:
+        if stream.get("local", False):
+            options = {"options": self.FFMPEG_OPTIONS["options"]}  # the reconnect options only apply to http inputs
+        else:
+            options = dict(self.FFMPEG_OPTIONS)
+        if startAt > 0:
+            # as an input option ffmpeg seeks in the source instead of decoding everything before the position
+            options["before_options"] = f"-ss {startAt:.2f} " + options.get("before_options", "")
+        if volumeFactor != 1:
+            options["options"] += f" -af volume={volumeFactor:.4f}"
+        return options
+
+    def getVolumeFactor(self, stream: dict) -> float:
+        # the track's loudness correction (once it was measured) and the guild's /volume, as one ffmpeg filter.
+        # Any filter means encoding youtube's opus again instead of remuxing it, so at the default volume a
+        # correction within LOUDNESS_TOLERANCE is left out: a difference that small is hardly audible
+        gain = 0.0
+        if self.cogMain.loudness is not None:
+            gain = self.cogMain.loudness.getGain(stream.get("id", None)) or 0.0
+        if self.volume == self.DEFAULT_VOLUME and abs(gain) <= self.LOUDNESS_TOLERANCE:
+            return 1.0
+        return round(10 ** (gain / 20) * self.volume / 100, 4)
 
     def getVoiceClient(self) -> VoiceClient:
         return self.guild.voice_client
 
-    def addToQueue(self, requestInput, requester) -> SongAddedData:  # will return info about what was added
-        return self.nodePseudoFactory.interpretRequest(requestInput, requester)
+    async def addToQueue(self, requestInput, requester) -> SongAddedData:  # will return info about what was added
+        # the request is resolved on the extraction pool so a slow link doesn't stall the other guilds
+        with self.span("interpret_request"):
+            addedData = await self.cogMain.extractor.run(
+                self.guild.id, self.nodePseudoFactory.interpretRequest, requestInput, requester
+            )
+        await self.commandHandler.enqueue(addedData.songs)
+        return addedData
+
+    async def addRemainingPages(self, addedData: SongAddedData, onPage: Callable[[], Awaitable]):
+        # queues the rest of a big playlist page by page, so the first page can already be playing
+        generation = self.ingestionGeneration
+        while addedData.pages is not None:
+            try:
+                nodes = await self.cogMain.extractor.runIngestion(self.guild.id, next, addedData.pages, None)
+            except Exception as e:
+                self.logger.error(f"stopped adding playlist pages after {addedData.count} songs: {e!r}")
+                addedData.failed = True
+                nodes = None
+            if generation != self.ingestionGeneration or nodes is None:
+                addedData.pages = None  # done, failed, or the queue was stopped meanwhile
+            else:
+                await self.commandHandler.enqueue(nodes)
+                addedData.addPage(nodes)
+            await onPage()
 
     async def wakeUp(self):
-        vCl = self.getVoiceClient()
-
-        if not vCl.is_playing() and not vCl.is_paused():
-            await self.playNext()
+        await self.commandHandler.play()
 
     def isPaused(self):
         return self.getVoiceClient().is_paused()
 
-    def pause(self):
-        self.commandHandler.pause()
+    async def pause(self) -> bool:  # returns whether it is paused now
+        return await self.commandHandler.pause()
 
-    def skip(self, jumpTo):
-        self.commandHandler.skip(jumpTo)
+    async def skip(self, jumpTo):
+        await self.commandHandler.skip(jumpTo)
 
-    def stop(self):
-        self.commandHandler.stop()
+    async def stop(self):
+        # pending extractions are dropped right away instead of waiting for their turn in the command queue
+        self.ingestionGeneration += 1
+        self.cogMain.extractor.cancel(self.guild.id)
+        await self.commandHandler.stop()
 
-    def setLoopMode(self, loopMode: LoopMode):
-        self.commandHandler.setLoopMode(loopMode)
+    async def setLoopMode(self, loopMode: LoopMode):
+        await self.commandHandler.setLoopMode(loopMode)
+
+    async def shuffle(self):
+        await self.commandHandler.shuffle()
+
+    async def removeFromQueue(self, position: int) -> AudioNode:
+        return await self.commandHandler.remove(position)
 
-    def getQueue(self, n: int) -> (list[dict], int):
-        if n < 0:
-            n = 0
-        if n * 15 > len(self.queue.queue):
-            n = len(self.queue.queue) // 15
-        return [{
-            "duration": node.getDuration(),
-            "url": node.getLink(),
-            "title": node.getTitle()
-        } for node in list(self.queue.queue)[n * 15: (n + 1) * 15]], n
+    async def moveInQueue(self, source: int, destination: int):
+        await self.commandHandler.move(source, destination)
+
+    async def setVolume(self, volume: int):
+        await self.commandHandler.setVolume(volume)
+
+    async def seek(self, position: Optional[float], delta: float = 0.0) -> Optional[float]:
+        return await self.commandHandler.seek(position, delta)
+
+    async def disconnect(self):
+        await self.commandHandler.disconnect()
+
+    def getQueuePage(self, page: int) -> (int, str):
+        return self.queuePages.render(page)
 
 
 class ComponentsView(nextcord.ui.View):
@@ -600,28 +1361,59 @@ class ComponentsView(nextcord.ui.View):
 
 
 class QueueButton(nextcord.ui.Button):
-    def __init__(self, guildContext: GuildVoiceContext, page: int, isRight: bool, **kwargs):
-        super().__init__(emoji="➡" if isRight else "⬅", **kwargs)
+    LAST_PAGE = -1  # resolved when clicked, the queue may have grown since the buttons were made
+
+    def __init__(self, guildContext: GuildVoiceContext, page: int, emoji: str, **kwargs):
+        super().__init__(emoji=emoji, **kwargs)
         self.guildContext = guildContext
         self.page = page
 
     async def callback(self, interaction: nextcord.Interaction):
-        songList, page = self.guildContext.getQueue(self.page)
-        embed, view = MusicCog.makeQueueEmbed(songList, page, self.guildContext)
-        await interaction.message.edit(embed=embed, view=view)
+        page = self.guildContext.queuePages.pageCount() - 1 if self.page == self.LAST_PAGE else self.page
+        embed, view = MusicCog.makeQueueEmbed(self.guildContext, page)
+        await interaction.response.edit_message(embed=embed, view=view)
+
+
+class QueueJumpButton(nextcord.ui.Button):
+    def __init__(self, guildContext: GuildVoiceContext, **kwargs):
+        super().__init__(emoji="🔢", **kwargs)
+        self.guildContext = guildContext
+
+    async def callback(self, interaction: nextcord.Interaction):
+        await interaction.response.send_modal(QueueJumpModal(self.guildContext))
+
+
+class QueueJumpModal(nextcord.ui.Modal):
+    def __init__(self, guildContext: GuildVoiceContext):
+        super().__init__("Go to page")
+        self.guildContext = guildContext
+        self.pageInput = nextcord.ui.TextInput(
+            label=f"Page (1-{guildContext.queuePages.pageCount()})", min_length=1, max_length=6, required=True
+        )
+        self.add_item(self.pageInput)
+
+    async def callback(self, interaction: nextcord.Interaction):
+        page = self.pageInput.value.strip()
+        if not page.isdigit():
+            await interaction.response.send_message("that's not a page number", ephemeral=True)
+            return
+        embed, view = MusicCog.makeQueueEmbed(self.guildContext, int(page) - 1)
+        await interaction.response.edit_message(embed=embed, view=view)
 
 
 class MusicCog(Cog):
+    PROGRESS_EDIT_INTERVAL = 2  # seconds between "Added to Queue" updates while a playlist is being added
+    ALIVE_INTERVAL = 15  # seconds between the journal's signs of life while playing, bounds the resume error
+    RESUME_END_MARGIN = 5  # seconds, a restored song this close to its end isn't resumed
 
     def __init__(self, client, botMain):
         self.client = client
         self.botMain = botMain
         self.guildContexts = {}
-        cred = getJson(path=botMain.path + "/cred/spotify_dev.json")
-        self.spotifyClient = spotipy.Spotify(
-            auth_manager=SpotifyClientCredentials(
-                client_id=cred["client_id"], client_secret=cred["client_secret"]
-            ))
+        self.config = getJson(botMain.path + "/config.json")
+        self.metrics = MetricsRegistry()
+        self.__spotifyClient = None
+        self.spotifyClientLock = threading.Lock()
         self.YDL_OPTIONS_FOR_AUDIO = {
             'format': 'bestaudio/bestaudio*',
             'noplaylist': True,
@@ -638,11 +1430,190 @@ class MusicCog(Cog):
             'hls-prefer-ffmpeg': True,
             'reject_title': '[Deleted video]'
         }
+        self.extractor = ExtractionExecutor(maxWorkers=4, perGuildLimit=2)
+        extractionConfig = self.config.get("extraction", {})
+        self.extractionService = ExtractionService(
+            {AUDIO_PROFILE: self.YDL_OPTIONS_FOR_AUDIO, PLAYLIST_PROFILE: self.YDL_OPTIONS_PLAYLIST},
+            processes=extractionConfig.get("processes", 2),
+            maxTasksPerChild=extractionConfig.get("max_tasks_per_child", 200),
+            timeout=extractionConfig.get("timeout", 60)
+        )
+        self.streamCache = StreamUrlCache(maxSize=2048, refreshExecutor=self.extractor.pool)
+        self.searchCache = SearchCache(maxSize=4096)
+        self.matchStore = SpotifyMatchStore(botMain.path + "/data/viktor.sqlite3")
+        self.lookaheadDepth = 2  # default for new guilds, changed per guild with /lookahead
         self.ffmpegExePath = "C:/ffmpeg/ffmpeg.exe"
+        self.playbackMode = PlaybackMode.Opus
+        audioCacheConfig = self.config.get("audio_cache", {})
+        self.audioCache: Optional[AudioFileCache] = AudioFileCache(
+            botMain.path + "/data/audio_cache", maxBytes=audioCacheConfig.get("max_megabytes", 2048) * 1024 ** 2,
+            playThreshold=audioCacheConfig.get("play_threshold", 3), ffmpegExePath=self.ffmpegExePath
+        ) if audioCacheConfig.get("enabled", False) else None
         self.FFMPEG_OPTIONS = {
             'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
             'options': '-vn'
         }
+        loudnessConfig = self.config.get("loudness", {})
+        self.loudness: Optional[LoudnessStore] = LoudnessStore(
+            botMain.path + "/data/viktor.sqlite3", self.ffmpegExePath,
+            targetLufs=loudnessConfig.get("target_lufs", -14.0),
+            analysisSeconds=loudnessConfig.get("analysis_seconds", 300)
+        ) if loudnessConfig.get("enabled", True) else None
+        persistenceConfig = self.config.get("persistence", {})
+        self.queueDirectory: Optional[str] = botMain.path + "/data/queues" \
+            if persistenceConfig.get("enabled", True) else None
+        self.resumePlayback = persistenceConfig.get("resume_playback", False)
+        self.snapshotEvery = persistenceConfig.get("snapshot_every", 500)
+        # every guild's journal files are written on this thread, in the order they were journaled
+        self.journalWriter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="queue-journal")
+        self.queuesRestored = False
+        self.aliveTask: Optional[asyncio.Task] = None
+        inactivityConfig = self.config.get("inactivity", {})
+        self.inactivity = InactivityManager(
+            self, disconnectAfter=inactivityConfig.get("disconnect_after", 300),
+            hibernateAfter=inactivityConfig.get("hibernate_after", 900)
+        )
+        self.registerGauges()
+        metricsConfig = self.config.get("metrics", {})
+        self.prometheusEndpoint: Optional[PrometheusEndpoint] = PrometheusEndpoint(
+            self.metrics, host=metricsConfig.get("prometheus_host", "127.0.0.1"),
+            port=metricsConfig["prometheus_port"]
+        ) if metricsConfig.get("prometheus_port", None) else None
+
+        if not self.config.get("startup", {}).get("lazy_imports", True):
+            self.warmUp()
+
+    @property
+    def spotifyClient(self):
+        # built on first use, it's only needed once someone plays something from spotify
+        if self.__spotifyClient is None:
+            with self.spotifyClientLock:
+                if self.__spotifyClient is None:
+                    cred = getJson(path=self.botMain.path + "/cred/spotify_dev.json")
+                    self.__spotifyClient = spotipy.Spotify(
+                        auth_manager=spotipyOauth.SpotifyClientCredentials(
+                            client_id=cred["client_id"], client_secret=cred["client_secret"]
+                        ))
+        return self.__spotifyClient
+
+    def warmUp(self):
+        self.extractionService.warmUp()
+        self.spotifyClient
+
+    def makeJournal(self, guildContext: "GuildVoiceContext") -> Union[QueueJournal, DisabledQueueJournal]:
+        if self.queueDirectory is None:
+            return DisabledQueueJournal()
+        return QueueJournal(self.queueDirectory, guildContext.guild.id, lambda node: node.toRecord(),
+                            guildContext.getPersistentState, snapshotEvery=self.snapshotEvery,
+                            writer=self.journalWriter)
+
+    async def restoreQueues(self):
+        # rebuilds the queues the journals have from the last run, no request is made to resolve them again
+        startedAt = time.perf_counter()
+        restored = []
+        for guildId in QueueJournal.listGuilds(self.queueDirectory):
+            guild = self.client.get_guild(guildId)
+            try:
+                state = QueueJournal.load(self.queueDirectory, guildId)
+                if guild is None or state is None:
+                    continue
+                guildContext = self.getGuildContext(guild)
+                resumeAt = guildContext.restoreState(state, self.resumePlayback)
+            except Exception as e:
+                # one guild's broken files don't keep the others from coming back
+                logging.getLogger("viktor.music").error(f"couldn't restore the queue of {guildId}: {e!r}")
+                QueueJournal.setAside(self.queueDirectory, guildId)
+                continue
+            restored.append((guildContext, resumeAt))
+        logging.getLogger("viktor.music").info(
+            f"restored {len(restored)} queues in {(time.perf_counter() - startedAt) * 1000:.1f} ms"
+        )
+        if self.resumePlayback:
+            await asyncio.gather(*(
+                self.resumeGuild(guildContext) for guildContext, resumeAt in restored if resumeAt is not None
+            ))
+
+    @staticmethod
+    async def resumeGuild(guildContext: "GuildVoiceContext"):
+        channel = guildContext.guild.get_channel(guildContext.voiceChannelId or 0)
+        if channel is None:
+            return
+        try:
+            if guildContext.getVoiceClient() is None:
+                await channel.connect()
+            await guildContext.wakeUp()
+        except (asyncio.TimeoutError, nextcord.ClientException) as e:
+            guildContext.logger.warning(f"couldn't resume playback in {channel.id}: {e!r}")
+
+    async def aliveLoop(self):
+        while True:
+            await asyncio.sleep(self.ALIVE_INTERVAL)
+            for guildContext in list(self.guildContexts.values()):
+                try:
+                    voiceClient = guildContext.getVoiceClient()  # None when kicked out of the voice channel
+                    if guildContext.nodePlaying is not None and voiceClient is not None and not voiceClient.is_paused():
+                        guildContext.journal.markAlive()
+                except Exception as e:
+                    guildContext.logger.error(f"alive record failed: {e!r}")  # the other guilds still get theirs
+
+    def registerGauges(self):
+        self.metrics.gauge("guilds", lambda: len(self.guildContexts))
+        self.metrics.gauge("active_guilds", lambda: sum(
+            gc.isActive() for gc in list(self.guildContexts.values())
+        ))
+        self.metrics.gauge("connected_guilds", lambda: sum(
+            gc.isConnected() for gc in list(self.guildContexts.values())
+        ))
+        self.metrics.gauge("hibernated_guilds", lambda: len(self.inactivity.hibernated))
+        self.metrics.gauge("hibernations", lambda: self.inactivity.hibernations)
+        self.metrics.gauge("idle_disconnects", lambda: self.inactivity.disconnects)
+        self.metrics.gauge("queued_songs", lambda: sum(len(gc.queue) for gc in list(self.guildContexts.values())))
+        self.metrics.gauge("stream_cache_size", lambda: len(self.streamCache.entries))
+        self.metrics.gauge("stream_cache_hit_rate", lambda: self.streamCache.getStats()["hitRate"])
+        self.metrics.gauge("search_cache_hit_rate", lambda: self.searchCache.getStats()["hitRate"])
+        self.metrics.gauge("extraction_timeouts", lambda: self.extractionService.timeouts)
+        self.metrics.gauge("extraction_fallbacks", lambda: self.extractionService.fallbacks)
+        self.metrics.gauge("rest_calls_saved", lambda: sum(
+            gc.nowPlaying.getStats()["restCallsSaved"] for gc in list(self.guildContexts.values())
+        ))
+        if self.audioCache is not None:
+            self.metrics.gauge("audio_cache_bytes", lambda: self.audioCache.totalBytes)
+        if self.loudness is not None:
+            self.metrics.gauge("loudness_measured", lambda: self.loudness.measured)
+            self.metrics.gauge("loudness_pending", lambda: len(self.loudness.pending))
+
+    @Cog.listener()
+    async def on_ready(self):
+        if self.config.get("startup", {}).get("warm_after_ready", True):
+            self.extractor.backgroundPool.submit(self.warmUp)
+        self.inactivity.start()
+        if self.queueDirectory is not None and not self.queuesRestored:
+            self.queuesRestored = True  # on_ready comes again after reconnects
+            self.aliveTask = asyncio.create_task(self.aliveLoop())
+            await self.restoreQueues()
+        if self.prometheusEndpoint is not None:
+            try:
+                await self.prometheusEndpoint.start()
+            except OSError as e:
+                logging.getLogger("viktor.music").error(f"metrics endpoint unavailable: {e!r}")
+
+    def cog_unload(self):
+        self.inactivity.close()
+        if self.aliveTask is not None:
+            self.aliveTask.cancel()
+        for guildContext in self.guildContexts.values():
+            guildContext.journal.snapshot()
+            guildContext.journal.close()
+        self.journalWriter.shutdown(wait=True)  # the snapshots above are on disk before the bot exits
+        self.extractionService.shutdown()
+        if self.prometheusEndpoint is not None:
+            self.prometheusEndpoint.close()
+        self.extractor.shutdown()
+        if self.audioCache is not None:
+            self.audioCache.shutdown()
+        if self.loudness is not None:
+            self.loudness.shutdown()
+        self.matchStore.close()
 
     @staticmethod
     async def getSendingRequestMessage(inter):
@@ -656,6 +1627,7 @@ class MusicCog(Cog):
         if gc == {}:
             gc = GuildVoiceContext(guild, self)
             self.guildContexts[guild.id] = gc
+            self.inactivity.wake(gc)
         return gc
 
     @staticmethod
@@ -668,10 +1640,11 @@ class MusicCog(Cog):
 
     @staticmethod
     def getUserVc(inter: Interaction) -> VoiceChannel:
-        for vc in inter.guild.voice_channels:
-            if inter.user in vc.members:
-                return vc
-        raise UserNotInVoiceChannel
+        # read from the member's voice state instead of looking through every channel's members
+        voice = getattr(inter.user, "voice", None)
+        if voice is None or voice.channel is None:
+            raise UserNotInVoiceChannel
+        return voice.channel
 
     @slash_command("test")
     async def joinCall(self, inter: Interaction):
@@ -692,19 +1665,40 @@ class MusicCog(Cog):
 
     @slash_command("play")
     async def play(self, inter: Interaction, link: str):
+        startedAt = time.perf_counter()
         await self.guarantee(inter)
         guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
         if guildContext.replyChannel is None:
             guildContext.replyChannel = inter.channel
-        msg = await self.getSendingRequestMessage(inter)
+        guildContext.rememberChannels()
+        with guildContext.span("discord_rest"):
+            msg = await self.getSendingRequestMessage(inter)
         try:
-            addedData = guildContext.addToQueue(link, inter.user)
+            wasIdle = guildContext.nodePlaying is None
+            addedData = await guildContext.addToQueue(link, inter.user)
             await guildContext.wakeUp()
-            await msg.edit(embed=addedData.getEmbed())
+            if wasIdle and guildContext.nodePlaying is not None:
+                self.metrics.histogram("time_to_first_audio", inter.guild.id).observe(time.perf_counter() - startedAt)
+            with guildContext.span("discord_rest"):
+                await msg.edit(embed=addedData.getEmbed())
+            if addedData.pages is not None:
+                lastEdit = time.monotonic()
+
+                async def onPage():
+                    nonlocal lastEdit
+                    if addedData.pages is None or time.monotonic() - lastEdit >= self.PROGRESS_EDIT_INTERVAL:
+                        lastEdit = time.monotonic()
+                        await msg.edit(embed=addedData.getEmbed())
+
+                await guildContext.addRemainingPages(addedData, onPage)
+        except asyncio.CancelledError:
+            await msg.edit("The request was cancelled.")
         except InvalidLinkException:
             await msg.edit("Invalid Link Exception")
         except NoSearchResultsException:
             await msg.edit("No results were found for the given query.")
+        except ExtractionTimeoutException:
+            await msg.edit("YouTube took too long to answer, try again in a bit.")
 
     @slash_command("test2")
     async def forcePlay2(self, inter: Interaction):
@@ -730,7 +1724,7 @@ class MusicCog(Cog):
             for item in playlist_items
         ]
 
-        info = YoutubeAudioNode.searchYTFirstResult(q[0], self.YDL_OPTIONS_FOR_AUDIO)
+        info = YoutubeAudioNode.searchYTFirstResult(q[0], guildContext)
         audioSource = info.get("url", "Unknown")
 
         ffmpegAudioSource: AudioSource = FFmpegPCMAudio(
@@ -743,57 +1737,96 @@ class MusicCog(Cog):
     async def pause(self, inter: Interaction):
         await self.guarantee(inter)
         guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
-        guildContext.pause()
-        await inter.send("paused" if guildContext.isPaused() else "resumed")
+        paused = await guildContext.pause()
+        await inter.send("paused" if paused else "resumed")
 
     @slash_command("skip")
     async def skip(self, inter: Interaction, jump_to: int = SlashOption(
-        required=False, min_value=1, max_value=500, default=1,
+        required=False, min_value=1, default=1,
         name="jump_to", description="the number of song the you wish to skip to"
     )):
         await self.guarantee(inter)
         guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
         await inter.send("skipped")
-        guildContext.skip(jump_to)
+        await guildContext.skip(jump_to)
 
     @slash_command("stop")
     async def stop(self, inter: Interaction):
         await self.guarantee(inter)
         guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
         await inter.send("stopped")
-        guildContext.stop()
+        await guildContext.stop()
 
     @staticmethod
-    def makeQueueEmbed(songList, page, guildContext):
-        desc = "\n".join([f"**Page {page + 1}:**"] + [
-            f"``[{1 + i + page * 15:02}]``\\[[{formatDuration(song['duration'])}]({song['url']})\\] ``{song['title']:.50}``"
-            for i, song in enumerate(songList)
-        ])
+    def makeQueueEmbed(guildContext: GuildVoiceContext, page: int):
+        page, rows = guildContext.getQueuePage(page)
+        pageCount = guildContext.queuePages.pageCount()
         embed = Embed(
-            description=desc,
+            description=f"**Page {page + 1}/{pageCount}:**\n{rows}",
             colour=Color.blue()
         )
         embed.set_author(name="QUEUE")
+        embed.set_footer(text=f"{len(guildContext.queue)} songs, {formatDuration(guildContext.queue.totalDuration)}")
+        isFirst, isLast = page <= 0, page >= pageCount - 1
         view = ComponentsView([
-            QueueButton(guildContext, page - 1, False),
-            QueueButton(guildContext, page + 1, True),
-
+            QueueButton(guildContext, 0, "⏮", disabled=isFirst),
+            QueueButton(guildContext, page - 1, "⬅", disabled=isFirst),
+            QueueButton(guildContext, page + 1, "➡", disabled=isLast),
+            QueueButton(guildContext, QueueButton.LAST_PAGE, "⏭", disabled=isLast),
+            QueueJumpButton(guildContext, disabled=pageCount <= 1)
         ])
         return embed, view
 
     @slash_command("queue")
     async def queue(self, inter: Interaction, page: int = SlashOption(
-        required=False, min_value=1, max_value=50, default=1,
+        required=False, min_value=1, default=1,
         name="page", description="the page of 15 songs in the queue"
     )):
         await self.guarantee(inter)
         guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
         msg = await self.getSendingRequestMessage(inter)
         # TODO don't allow if there are no songs
-        songList, page = guildContext.getQueue(page - 1)
-        embed, view = self.makeQueueEmbed(songList, page, guildContext)
+        embed, view = self.makeQueueEmbed(guildContext, page - 1)
         await msg.edit(embed=embed, view=view)
 
+    @slash_command("shuffle")
+    async def shuffle(self, inter: Interaction):
+        await self.guarantee(inter)
+        guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
+        await guildContext.shuffle()
+        await inter.send("shuffled")
+
+    @slash_command("remove")
+    async def remove(self, inter: Interaction, position: int = SlashOption(
+        required=True, min_value=1,
+        name="position", description="the number of the song in the queue"
+    )):
+        await self.guarantee(inter)
+        guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
+        try:
+            node = await guildContext.removeFromQueue(position - 1)
+        except IndexError:
+            await inter.send("there is no song with that number in the queue")
+            return
+        await inter.send(f"removed ``{node.getTitle():.50}``")
+
+    @slash_command("move")
+    async def move(self, inter: Interaction, position: int = SlashOption(
+        required=True, min_value=1,
+        name="position", description="the number of the song in the queue"
+    ), new_position: int = SlashOption(
+        required=True, min_value=1,
+        name="new_position", description="the number it should have in the queue"
+    )):
+        await self.guarantee(inter)
+        guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
+        try:
+            await guildContext.moveInQueue(position - 1, new_position - 1)
+        except IndexError:
+            await inter.send("there is no song with that number in the queue")
+            return
+        await inter.send("moved")
+
     @slash_command("loop")
     async def loop(self, inter: Interaction, loopMode: int = SlashOption(
         required=True, choices={
@@ -807,7 +1840,92 @@ class MusicCog(Cog):
         # TODO loop ain't working whatsever :skull:
         guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
         await inter.send("loop mode changed")
-        guildContext.setLoopMode(LoopMode(loopMode))
+        await guildContext.setLoopMode(LoopMode(loopMode))
+
+    @slash_command("rematch")
+    async def rematch(self, inter: Interaction):
+        await self.guarantee(inter)
+        guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
+        node = guildContext.nodePlaying
+        if not isinstance(node, SpotifyAudioNode):
+            await inter.send("the song playing isn't from spotify")
+            return
+        self.matchStore.invalidate(node.spotifyId)
+        node.youtubeId = None
+        await inter.send("this youtube match won't be used again for this song")
+
+    @slash_command("lookahead")
+    async def lookahead(self, inter: Interaction, depth: int = SlashOption(
+        required=True, min_value=0, max_value=10,
+        name="depth", description="how many of the next songs are prepared in advance"
+    )):
+        await self.guarantee(inter)
+        guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
+        guildContext.preResolver.setDepth(depth)
+        await inter.send(f"now preparing the next {depth} songs in advance")
+
+    @slash_command("seek")
+    async def seek(self, inter: Interaction, position: str = SlashOption(
+        required=True, name="position", description="where to continue the song from, like 1:30 or 90"
+    )):
+        await self.guarantee(inter)
+        seconds = parseTimestamp(position)
+        if seconds is None:
+            await inter.send("the position should look like 90, 1:30 or 1:02:03")
+            return
+        await self.sendSeekResult(inter, await self.getGuildContext(inter.guild).seek(seconds))
+
+    @slash_command("rewind")
+    async def rewind(self, inter: Interaction, seconds: int = SlashOption(
+        required=False, default=10, min_value=1,
+        name="seconds", description="how far back to go, 10 seconds by default"
+    )):
+        await self.guarantee(inter)
+        await self.sendSeekResult(inter, await self.getGuildContext(inter.guild).seek(None, -seconds))
+
+    @staticmethod
+    async def sendSeekResult(inter: Interaction, position: Optional[float]):
+        if position is None:
+            await inter.send("nothing is playing")
+        else:
+            await inter.send(f"continuing from {formatDuration(int(position))}")
+
+    @slash_command("volume")
+    async def volume(self, inter: Interaction, percent: int = SlashOption(
+        required=True, min_value=0, max_value=200,
+        name="percent", description="100 is the normal volume"
+    )):
+        await self.guarantee(inter)
+        guildContext: GuildVoiceContext = self.getGuildContext(inter.guild)
+        await guildContext.setVolume(percent)
+        await inter.send(f"volume set to {percent}%")
+
+    @staticmethod
+    def formatSummaries(summaries: dict[str, dict]) -> str:
+        return "\n".join(
+            f"``{name}`` n={summary['count']} p50={summary['p50'] * 1000:.0f}ms "
+            f"p95={summary['p95'] * 1000:.0f}ms max={summary['max'] * 1000:.0f}ms"
+            for name, summary in summaries.items() if summary["count"] > 0
+        ) or "nothing measured yet"
+
+    @slash_command("stats", default_member_permissions=Permissions(administrator=True))
+    async def stats(self, inter: Interaction):
+        if not inter.user.guild_permissions.administrator:
+            await inter.send("only administrators can see the stats", ephemeral=True)
+            return
+        embed = Embed(colour=Color.blue())
+        embed.set_author(name="STATS")
+        embed.add_field(name="This server", value=self.formatSummaries(self.metrics.getSummaries(inter.guild.id))[:1024],
+                        inline=False)
+        embed.add_field(name="All servers", value=self.formatSummaries(self.metrics.getSummaries())[:1024],
+                        inline=False)
+        gauges = self.metrics.readGauges()
+        if inter.guild.id in self.guildContexts:
+            gauges.update(self.guildContexts[inter.guild.id].nowPlaying.getStats())
+        embed.add_field(name="Gauges", value="\n".join(
+            f"``{name}`` {value:g}" for name, value in gauges.items()
+        )[:1024] or "none", inline=False)
+        await inter.send(embed=embed, ephemeral=True)
 
     @slash_command("test3")
     async def choose_a_number(
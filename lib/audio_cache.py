@@ -0,0 +1,131 @@
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+class AudioFileCache:
+    # Keeps opus files of the songs played the most, keyed by youtube video id, so they start from disk instead of
+    # being streamed again. A song is only downloaded in the background once it reaches `playThreshold` plays,
+    # files are written to a temporary name and renamed once complete, and the least recently played ones are
+    # deleted when the cache goes over `maxBytes`.
+    EXTENSION = ".opus"
+    MAX_TRACKED_PLAY_COUNTS = 20000
+
+    def __init__(self, directory: str, maxBytes: int, playThreshold: int, ffmpegExePath: str,
+                 fillTimeout: float = 10 * 60):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.playThreshold = playThreshold
+        self.ffmpegExePath = ffmpegExePath
+        self.fillTimeout = fillTimeout
+        self.fillPool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-cache")
+
+        self.files: OrderedDict[str, int] = OrderedDict()  # video id -> size, least recently played first
+        self.totalBytes = 0
+        self.playCounts: dict[str, int] = {}
+        self.filling: set[str] = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.loadDirectory()
+
+    def loadDirectory(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(".part"):
+                os.remove(path)  # leftovers of fills interrupted by a restart
+            if not filename.endswith(self.EXTENSION):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, filename[:-len(self.EXTENSION)], stat.st_size))
+        for _, videoId, size in sorted(entries):
+            self.files[videoId] = size
+            self.totalBytes += size
+        self.enforceBudget()
+
+    def getFilePath(self, videoId: str) -> str:
+        return os.path.join(self.directory, videoId + self.EXTENSION)
+
+    def getPath(self, videoId: Optional[str]) -> Optional[str]:
+        if videoId is None:
+            return None
+        with self.lock:
+            if videoId not in self.files:
+                return None
+            self.files.move_to_end(videoId)
+            self.hits += 1
+        path = self.getFilePath(videoId)
+        try:
+            os.utime(path)  # keeps the lru order across restarts
+        except OSError:
+            with self.lock:
+                self.totalBytes -= self.files.pop(videoId, 0)
+            return None
+        return path
+
+    def getStream(self, videoId: Optional[str]) -> Optional[dict]:
+        path = self.getPath(videoId)
+        if path is None:
+            return None
+        return {"id": videoId, "url": path, "acodec": "opus", "abr": None, "ext": "opus", "local": True}
+
+    def recordPlay(self, stream: dict):
+        videoId = stream.get("id", None)
+        if videoId is None or stream.get("local", False):
+            return
+        with self.lock:
+            self.playCounts[videoId] = count = self.playCounts.pop(videoId, 0) + 1
+            if len(self.playCounts) > self.MAX_TRACKED_PLAY_COUNTS:
+                del self.playCounts[next(iter(self.playCounts))]  # the one played least recently
+            if count < self.playThreshold or videoId in self.files or videoId in self.filling:
+                return
+            self.filling.add(videoId)
+        self.fillPool.submit(self.fill, videoId, stream["url"], stream.get("acodec", None))
+
+    def fill(self, videoId: str, url: str, codec: Optional[str]):
+        path = self.getFilePath(videoId)
+        temporaryPath = path + ".part"
+        try:
+            subprocess.run([
+                self.ffmpegExePath, "-loglevel", "error", "-y",
+                "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5", "-i", url,
+                "-vn", *(["-c:a", "copy"] if codec == "opus" else ["-c:a", "libopus", "-b:a", "128k"]),
+                "-f", "opus", temporaryPath
+            ], check=True, timeout=self.fillTimeout, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL)
+            os.replace(temporaryPath, path)
+            size = os.path.getsize(path)
+            with self.lock:
+                self.files[videoId] = size
+                self.totalBytes += size
+                self.playCounts.pop(videoId, None)
+            self.enforceBudget()
+        except (OSError, subprocess.SubprocessError):
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+        finally:
+            with self.lock:
+                self.filling.discard(videoId)
+
+    def enforceBudget(self):
+        with self.lock:
+            evicted = []
+            while self.totalBytes > self.maxBytes and self.files:
+                videoId, size = self.files.popitem(last=False)
+                self.totalBytes -= size
+                evicted.append(videoId)
+        for videoId in evicted:
+            try:
+                os.remove(self.getFilePath(videoId))
+            except OSError:
+                pass
+
+    def getStats(self) -> dict:
+        return {"files": len(self.files), "bytes": self.totalBytes, "hits": self.hits, "filling": len(self.filling)}
+
+    def shutdown(self):
+        self.fillPool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,185 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Callable, Hashable, Optional
+
+
+class CacheEntry:
+    __slots__ = ("value", "expiresAt")
+
+    def __init__(self, value, expiresAt: float):
+        self.value = value
+        self.expiresAt: float = expiresAt  # unix timestamp
+
+
+class TTLCache:
+    # LRU cache where every entry also carries its own expiry time. Thread safe, since it is read from the
+    # extraction workers as well as from the event loop.
+    def __init__(self, maxSize: int, defaultTtl: float):
+        self.maxSize = maxSize
+        self.defaultTtl = defaultTtl
+        self.entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def getEntry(self, key) -> Optional[CacheEntry]:
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None and entry.expiresAt <= time.time():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get(self, key, default=None):
+        entry = self.getEntry(key)
+        return default if entry is None else entry.value
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        self.putUntil(key, value, time.time() + (self.defaultTtl if ttl is None else ttl))
+
+    def putUntil(self, key, value, expiresAt: float):
+        with self.lock:
+            self.entries[key] = CacheEntry(value, expiresAt)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def getStats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class StreamUrlCache(TTLCache):
+    # Caches the resolved stream of a YouTube video by its id. googlevideo urls stop working at the
+    # timestamp in their "expire" parameter, so entries are dropped a bit before that and refreshed in the
+    # background once they get close to it.
+    EXPIRE_PATTERN = re.compile(r"[?&/]expire[=/](\d+)")
+    INFO_KEYS = ("id", "url", "title", "duration", "uploader", "acodec", "abr", "ext")
+
+    def __init__(self, maxSize: int = 2048, defaultTtl: float = 60 * 60, safetyMargin: float = 60,
+                 refreshBefore: float = 15 * 60, refreshExecutor: Optional[Executor] = None):
+        super().__init__(maxSize, defaultTtl)
+        self.safetyMargin = safetyMargin
+        self.refreshBefore = refreshBefore
+        self.refreshExecutor = refreshExecutor
+        self.refreshing: set[str] = set()
+        self.refreshes = 0
+
+    @classmethod
+    def getUrlExpiry(cls, url: str) -> Optional[float]:
+        match = cls.EXPIRE_PATTERN.search(url)
+        return float(match.group(1)) if match else None
+
+    @classmethod
+    def trimInfo(cls, info: dict) -> dict:
+        # yt-dlp info dicts carry every format and thumbnail, only keep what playback needs
+        trimmed = {key: info.get(key, None) for key in cls.INFO_KEYS}
+        try:
+            trimmed["thumbnail"] = info["thumbnails"][-1]["url"]
+        except (KeyError, IndexError):
+            trimmed["thumbnail"] = info.get("thumbnail", None)
+        return trimmed
+
+    def putInfo(self, videoId: str, info: dict) -> dict:
+        trimmed = self.trimInfo(info)
+        expiry = self.getUrlExpiry(trimmed["url"] or "")
+        expiresAt = time.time() + self.defaultTtl if expiry is None else expiry - self.safetyMargin
+        self.putUntil(videoId, trimmed, expiresAt)
+        return trimmed
+
+    def getOrResolve(self, videoId: str, resolver: Callable[[], dict]) -> dict:
+        entry = self.getEntry(videoId)
+        if entry is None:
+            return self.putInfo(videoId, resolver())
+        if entry.expiresAt - time.time() < self.refreshBefore:
+            self.scheduleRefresh(videoId, resolver)
+        return entry.value
+
+    def scheduleRefresh(self, videoId: str, resolver: Callable[[], dict]):
+        if self.refreshExecutor is None:
+            return
+        with self.lock:
+            if videoId in self.refreshing:
+                return
+            self.refreshing.add(videoId)
+        self.refreshExecutor.submit(self.refresh, videoId, resolver)
+
+    def refresh(self, videoId: str, resolver: Callable[[], dict]):
+        try:
+            self.putInfo(videoId, resolver())
+            self.refreshes += 1
+        except Exception:
+            pass  # the stale entry is still usable until it expires
+        finally:
+            with self.lock:
+                self.refreshing.discard(videoId)
+
+    def getStats(self) -> dict:
+        stats = super().getStats()
+        stats["refreshes"] = self.refreshes
+        return stats
+
+
+class SearchCache(TTLCache):
+    # Caches the first youtube result of text searches, so a song typed again (in any guild) doesn't search again.
+    # Queries are folded first, so "Never Gonna Give You Up!" and "never gonna  give you up" share an entry.
+    def __init__(self, maxSize: int = 4096, defaultTtl: float = 24 * 60 * 60):
+        super().__init__(maxSize, defaultTtl)
+
+    @staticmethod
+    def normalizeQuery(query: str) -> str:
+        folded = unicodedata.normalize("NFKC", query).casefold()
+        folded = "".join(" " if unicodedata.category(char)[0] in "PSZ" else char for char in folded)
+        return " ".join(folded.split())
+
+    @staticmethod
+    def trimResult(info: dict) -> dict:
+        try:
+            thumbnail = info["thumbnails"][-1]["url"]
+        except (KeyError, IndexError):
+            thumbnail = info.get("thumbnail", None)
+        return {
+            "id": info.get("id", None),
+            "link": info.get("original_url", None) or info.get("webpage_url", None),
+            "title": info.get("title", None),
+            "duration": info.get("duration", None),
+            "uploader": info.get("uploader", None),
+            "thumbnail": thumbnail
+        }
+
+    def getResult(self, query: str) -> Optional[dict]:
+        return self.get(self.normalizeQuery(query))
+
+    def putResult(self, query: str, info: dict) -> dict:
+        result = self.trimResult(info)
+        self.put(self.normalizeQuery(query), result)
+        return result
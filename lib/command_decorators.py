@@ -11,7 +11,8 @@ class UnknownCommandError(Exception):
         super().__init__(f"There is no command with the id \"{command_id}\" in commands.json")
 
 
-def slash_command(command_id):
+def slash_command(command_id, **kwargs):
+    # kwargs go to nextcord's slash_command, e.g. default_member_permissions
     commandInfo = commandsInfo.get(command_id, {})
     if commandInfo == {}:
         raise UnknownCommandError(command_id)
@@ -20,7 +21,8 @@ def slash_command(command_id):
         return nextcord_slash_command(
             name=commandInfo["name"],
             description=commandInfo["description"],
-            guild_ids=config["default_guild_ids"]
+            guild_ids=config["default_guild_ids"],
+            **kwargs
         )(func)
 
     return decorator
@@ -0,0 +1,74 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class ExtractionExecutor:
+    # Runs blocking yt-dlp / spotipy work off the event loop.
+    # The worker pool is shared by every guild, while each guild gets its own semaphore so a single
+    # guild importing a huge playlist can't take every worker for itself. The remaining pages of a playlist being
+    # imported go through a separate semaphore (`ingestionLimit` per guild), so they never make the stream resolve
+    # of the next song wait.
+    def __init__(self, maxWorkers: int = 4, perGuildLimit: int = 2, backgroundWorkers: int = 1,
+                 ingestionLimit: int = 1):
+        self.pool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="extraction")
+        # low priority work (pre-resolving upcoming songs) gets its own small pool so it never holds the
+        # workers that user requests are waiting on
+        self.backgroundPool = ThreadPoolExecutor(max_workers=backgroundWorkers, thread_name_prefix="prefetch")
+        self.perGuildLimit = perGuildLimit
+        self.ingestionLimit = ingestionLimit
+        self.guildSemaphores: dict[int, asyncio.Semaphore] = {}
+        self.ingestionSemaphores: dict[int, asyncio.Semaphore] = {}
+        self.guildFutures: dict[int, set[asyncio.Future]] = {}
+
+    def getSemaphore(self, guildId: int, semaphores: Optional[dict[int, asyncio.Semaphore]] = None,
+                     limit: Optional[int] = None) -> asyncio.Semaphore:
+        semaphores = self.guildSemaphores if semaphores is None else semaphores
+        semaphore = semaphores.get(guildId, None)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.perGuildLimit if limit is None else limit)
+            semaphores[guildId] = semaphore
+        return semaphore
+
+    async def run(self, guildId: int, func: Callable, *args, **kwargs):
+        return await self.runLimited(self.getSemaphore(guildId), guildId, func, *args, **kwargs)
+
+    async def runIngestion(self, guildId: int, func: Callable, *args, **kwargs):
+        # the next page of a playlist being imported, cancelled with the guild's other jobs
+        semaphore = self.getSemaphore(guildId, self.ingestionSemaphores, self.ingestionLimit)
+        return await self.runLimited(semaphore, guildId, func, *args, **kwargs)
+
+    async def runLimited(self, semaphore: asyncio.Semaphore, guildId: int, func: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            future = loop.run_in_executor(self.pool, functools.partial(func, *args, **kwargs))
+            futures = self.guildFutures.setdefault(guildId, set())
+            futures.add(future)
+            try:
+                return await future
+            finally:
+                futures.discard(future)
+
+    async def runBackground(self, func: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.backgroundPool, functools.partial(func, *args, **kwargs))
+
+    def cancel(self, guildId: int):
+        # jobs that haven't started yet are dropped, running ones finish in the background but their
+        # results are discarded since the awaiting coroutine receives CancelledError
+        for future in list(self.guildFutures.get(guildId, ())):
+            future.cancel()
+
+    def forget(self, guildId: int):
+        # drops the guild's semaphore once it has nothing running, a new one is made if it comes back
+        if not self.guildFutures.get(guildId, None):
+            self.guildFutures.pop(guildId, None)
+            for semaphores in (self.guildSemaphores, self.ingestionSemaphores):
+                semaphore = semaphores.get(guildId, None)
+                if semaphore is not None and not semaphore.locked():
+                    del semaphores[guildId]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.backgroundPool.shutdown(wait=False, cancel_futures=True)
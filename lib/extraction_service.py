@@ -0,0 +1,260 @@
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from lib.caches import StreamUrlCache
+from lib.lazy import LazyModule
+
+yt_dlp = LazyModule("yt_dlp")
+
+# yt-dlp instances of the current process by profile name, built once per worker (or per thread when extracting
+# in the bot's own process) so extractors aren't initialized again for every call
+workerYdls: dict[str, object] = {}
+threadYdls = threading.local()
+workerLogLines: list[tuple[int, str]] = []
+
+YT_DLP_LOGGER = "viktor.music.yt_dlp"
+
+
+class ExtractionTimeoutException(Exception):
+    pass
+
+
+class YtDlpLogger:
+    # yt-dlp's logger interface on the "viktor.music.yt_dlp" logger. Workers have no handlers configured, so there
+    # the lines at or above the bot's level are kept and logged in the bot's process when the job comes back
+    def __init__(self, buffer: Optional[list] = None, level: int = logging.NOTSET):
+        self.logger = logging.getLogger(YT_DLP_LOGGER)
+        self.buffer = buffer
+        self.level = level
+
+    def log(self, level: int, msg):
+        if self.buffer is None:
+            self.logger.log(level, msg)
+        elif level >= self.level:
+            self.buffer.append((level, str(msg)))
+
+    def debug(self, msg):
+        self.log(logging.DEBUG, msg)
+
+    def warning(self, msg):
+        self.log(logging.WARNING, msg)
+
+    def error(self, msg):
+        self.log(logging.ERROR, msg)
+
+
+def initWorker(profiles: dict[str, dict], logLevel: int):
+    logger = YtDlpLogger(workerLogLines, logLevel)
+    for name, options in profiles.items():
+        workerYdls[name] = yt_dlp.YoutubeDL({**options, "logger": logger})
+
+
+def trimInfo(info: dict) -> dict:
+    # what the bot reads from a video, in the shape yt-dlp returns it, so only a few hundred bytes cross processes
+    trimmed = StreamUrlCache.trimInfo(info)
+    trimmed["webpage_url"] = info.get("webpage_url", None)
+    trimmed["original_url"] = info.get("original_url", None)
+    trimmed["thumbnails"] = [{"url": trimmed["thumbnail"]}] if trimmed["thumbnail"] is not None else []
+    return trimmed
+
+
+def trimResult(info: Optional[dict]) -> Optional[dict]:
+    if info is None:
+        return None
+    if "entries" not in info:
+        return trimInfo(info)
+    entries = []
+    for entry in info["entries"] or ():
+        if entry is not None:
+            trimmed = trimInfo(entry)
+            trimmed["playlist_index"] = entry.get("playlist_index", None)
+            entries.append(trimmed)
+    return {
+        "id": info.get("id", None),
+        "title": info.get("title", None),
+        "playlist_count": info.get("playlist_count", None),
+        "entries": entries
+    }
+
+
+def extractWith(ydl, url: str, params: Optional[dict]) -> Optional[dict]:
+    # params like playlist_items only apply to this call, the instance stays warm for the next one
+    if not params:
+        return trimResult(ydl.extract_info(url, download=False))
+    previous = {key: ydl.params.get(key, None) for key in params}
+    ydl.params.update(params)
+    try:
+        return trimResult(ydl.extract_info(url, download=False))
+    finally:
+        ydl.params.update(previous)
+
+
+def extractInWorker(profile: str, url: str, params: Optional[dict] = None) -> tuple[Optional[dict], list]:
+    # the log lines travel back with the result rather than through a queue a killed worker could leave corrupted
+    workerLogLines.clear()
+    try:
+        return extractWith(workerYdls[profile], url, params), list(workerLogLines)
+    except Exception as e:
+        e.ytDlpLogLines = list(workerLogLines)
+        raise
+
+
+def logWorkerLines(lines):
+    logger = logging.getLogger(YT_DLP_LOGGER)
+    for level, msg in lines:
+        logger.log(level, msg)
+
+
+class ExtractionService:
+    # Runs yt-dlp in a pool of worker processes, each keeping one warm YoutubeDL per options profile, so the
+    # extraction work (json parsing, signature deciphering) doesn't compete with the gateway for the GIL.
+    # Workers are replaced after `maxTasksPerChild` jobs to bound leaks (python 3.11+). A job taking longer than
+    # `timeout` raises ExtractionTimeoutException and the pool is swapped for a new one: its workers are killed and
+    # the jobs that were waiting behind the stuck one are submitted again to the new pool.
+    # If the pool crashes the job runs in this process instead, and after MAX_CRASHES crashes within
+    # CRASH_WINDOW seconds extraction stays in this process. With processes=0 it never leaves this process.
+    MAX_CRASHES = 3
+    CRASH_WINDOW = 10 * 60  # seconds
+
+    def __init__(self, profiles: dict[str, dict], processes: int = 2, maxTasksPerChild: Optional[int] = 200,
+                 timeout: float = 60):
+        self.profiles = {name: self.makePicklable(options) for name, options in profiles.items()}
+        self.processes = processes
+        self.maxTasksPerChild = maxTasksPerChild
+        self.timeout = timeout
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.retiredPools = weakref.WeakSet()  # replaced on purpose, what they still had is submitted again
+        self.lock = threading.Lock()
+        self.crashTimes: list[float] = []
+        self.jobs = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.fallbacks = 0
+        self.resubmissions = 0
+
+    @staticmethod
+    def makePicklable(options: dict) -> dict:
+        # a logger given here can't be sent to the workers, every process logs through its own YtDlpLogger instead
+        return {key: value for key, value in options.items() if key != "logger"}
+
+    def isPooled(self) -> bool:
+        return self.processes > 0
+
+    def getPool(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.pool is None:
+                options = {}
+                if sys.version_info >= (3, 11):
+                    options["max_tasks_per_child"] = self.maxTasksPerChild
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=initWorker,
+                    initargs=(self.profiles, logging.getLogger(YT_DLP_LOGGER).getEffectiveLevel()), **options
+                )
+            return self.pool
+
+    def replacePool(self, brokenPool: ProcessPoolExecutor):
+        with self.lock:
+            if self.pool is brokenPool:
+                self.pool = None
+            self.retiredPools.add(brokenPool)
+        # shutdown alone leaves a stuck worker running, and jobs already handed to it waiting behind its job
+        workers = list((getattr(brokenPool, "_processes", None) or {}).values())
+        brokenPool.shutdown(wait=False, cancel_futures=True)
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    def warmUp(self):
+        # starts the workers (or imports yt-dlp here) ahead of the first request
+        if not self.isPooled():
+            yt_dlp.load()
+            return
+        pool = self.getPool()
+        try:
+            for future in [pool.submit(time.sleep, 0) for _ in range(self.processes)]:
+                future.result()
+        except BrokenProcessPool:
+            self.crashes += 1
+            self.replacePool(pool)
+
+    def extract(self, profile: str, url: str, params: Optional[dict] = None) -> Optional[dict]:
+        # blocking, meant to be called from the extraction threads
+        self.jobs += 1
+        while self.isPooled():
+            pool = self.getPool()
+            try:
+                future = pool.submit(extractInWorker, profile, url, params)
+            except (BrokenProcessPool, RuntimeError):
+                if self.isRetired(pool):
+                    continue
+                return self.onCrash(pool, profile, url, params)
+            try:
+                result, logLines = future.result(timeout=self.timeout)
+                logWorkerLines(logLines)
+                return result
+            except FutureTimeoutError:
+                self.timeouts += 1
+                future.cancel()
+                self.replacePool(pool)
+                raise ExtractionTimeoutException(url)
+            except (BrokenProcessPool, CancelledError):
+                if self.isRetired(pool):
+                    continue
+                if future.cancelled():
+                    raise  # the service is shutting down
+                return self.onCrash(pool, profile, url, params)
+            except Exception as e:
+                logWorkerLines(getattr(e, "ytDlpLogLines", ()))
+                raise
+        return self.extractHere(profile, url, params)
+
+    def isRetired(self, pool: ProcessPoolExecutor) -> bool:
+        # whether another job's timeout or crash replaced the pool, the job then goes to the new pool
+        if pool in self.retiredPools:
+            self.resubmissions += 1
+            return True
+        return False
+
+    def onCrash(self, pool: ProcessPoolExecutor, profile: str, url: str, params: Optional[dict]) -> Optional[dict]:
+        self.crashes += 1
+        self.replacePool(pool)
+        now = time.monotonic()
+        self.crashTimes = [crashTime for crashTime in self.crashTimes if now - crashTime < self.CRASH_WINDOW]
+        self.crashTimes.append(now)
+        if len(self.crashTimes) >= self.MAX_CRASHES:
+            self.processes = 0  # something keeps killing the workers, stop using them
+        self.fallbacks += 1
+        return self.extractHere(profile, url, params)
+
+    def extractHere(self, profile: str, url: str, params: Optional[dict] = None) -> Optional[dict]:
+        ydls = getattr(threadYdls, "ydls", None)
+        if ydls is None:
+            ydls = threadYdls.ydls = {}
+        ydl = ydls.get(profile, None)
+        if ydl is None:
+            ydl = ydls[profile] = yt_dlp.YoutubeDL({**self.profiles[profile], "logger": YtDlpLogger()})
+        return extractWith(ydl, url, params)
+
+    def getStats(self) -> dict:
+        return {
+            "processes": self.processes,
+            "jobs": self.jobs,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "fallbacks": self.fallbacks,
+            "resubmissions": self.resubmissions
+        }
+
+    def shutdown(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
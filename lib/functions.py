@@ -1,6 +1,7 @@
 import os
+import sys
 import json
-from django.core.validators import URLValidator, ValidationError
+from typing import Optional
 
 
 def getJson(path):
@@ -20,12 +21,17 @@ def formatDuration(seconds: int | float):
         return f"{minutes}:{seconds:02}"
 
 
-validator = URLValidator()
+def parseTimestamp(text: str) -> Optional[int]:
+    # "90", "1:30" or "1:02:03" in seconds, None when it's none of those
+    parts = text.strip().split(":")
+    if not 1 <= len(parts) <= 3 or not all(part.isdigit() for part in parts):
+        return None
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + int(part)
+    return seconds
 
 
-def isUrlValid(url: str) -> bool:
-    try:
-        validator(url)
-        return True
-    except ValidationError:
-        return False
+def internOptional(value: Optional[str]) -> Optional[str]:
+    return None if value is None else sys.intern(value)
+
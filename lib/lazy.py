@@ -0,0 +1,26 @@
+import importlib
+import threading
+from types import ModuleType
+from typing import Optional
+
+
+class LazyModule:
+    # Stands in for a module that is slow to import (yt_dlp loads hundreds of extractors) and imports it the first
+    # time one of its attributes is used, or when load() is called to warm it up in the background.
+    def __init__(self, name: str):
+        self.__name = name
+        self.__module: Optional[ModuleType] = None
+        self.__lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        if self.__module is None:
+            with self.__lock:
+                if self.__module is None:
+                    self.__module = importlib.import_module(self.__name)
+        return self.__module
+
+    def isLoaded(self) -> bool:
+        return self.__module is not None
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.load(), attribute)
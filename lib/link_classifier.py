@@ -0,0 +1,96 @@
+import re
+from enum import Enum
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class MediaType(Enum):
+    Song = 0
+    Video = 1
+    Playlist = 2
+    Album = 3
+    Artist = 4
+    Episode = 5
+
+
+class Provider(Enum):
+    Unknown = 0  # a link to something that can't be played
+    Search = 1  # plain text, searched on youtube
+    Youtube = 2
+    Spotify = 3
+
+
+class LinkInfo(NamedTuple):
+    provider: Provider
+    mediaType: Optional[MediaType]
+    id: Optional[str]  # the query itself for searches
+    startIndex: Optional[int] = None  # 1-based, for playlist links that point into the playlist
+
+
+UNKNOWN = LinkInfo(Provider.Unknown, None, None)
+
+YOUTUBE_ID_PATTERN = re.compile(r"^[\w-]{11}$")
+YOUTUBE_PATH_PATTERN = re.compile(r"^/(?:shorts|live|embed|v|e)/([\w-]{11})(?:[/?#]|$)")
+YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com", "gaming.youtube.com"}
+SPOTIFY_HOSTS = {"open.spotify.com", "play.spotify.com"}
+# without a scheme or www. only the hosts played from count as links, so searches like "Dr.Dre" stay searches
+URL_PATTERN = re.compile(
+    r"^(?:[a-z][a-z\d+.-]*://|www\.)"  # explicit scheme or www.
+    r"|^(?:" + "|".join(map(re.escape, sorted({"youtu.be", *YOUTUBE_HOSTS, *SPOTIFY_HOSTS}, key=len, reverse=True)))
+    + r")(?:[/:?#]|$)",  # or a known bare host name, e.g. youtu.be/...
+    re.IGNORECASE
+)
+SPOTIFY_PATH_PATTERN = re.compile(
+    r"^(?:/intl-[\w-]+)?(?:/embed)?/(track|album|playlist|artist|episode)/([A-Za-z\d]{22})(?:[/?#]|$)"
+)
+SPOTIFY_URI_PATTERN = re.compile(r"^spotify:(track|album|playlist|artist|episode):([A-Za-z\d]{22})$")
+SPOTIFY_MEDIA_TYPES = {
+    "track": MediaType.Song,
+    "album": MediaType.Album,
+    "playlist": MediaType.Playlist,
+    "artist": MediaType.Artist,
+    "episode": MediaType.Episode
+}
+
+
+def classifyRequest(request: str) -> LinkInfo:
+    # parses what was given to /play once and tells where it should be played from
+    request = request.strip().strip("<>")
+    if (uriMatch := SPOTIFY_URI_PATTERN.match(request)) is not None:
+        return LinkInfo(Provider.Spotify, SPOTIFY_MEDIA_TYPES[uriMatch.group(1)], uriMatch.group(2))
+    if not URL_PATTERN.match(request):
+        return LinkInfo(Provider.Search, None, request) if request else UNKNOWN
+
+    try:
+        url = urlsplit(request if "://" in request else "https://" + request)
+        host = (url.hostname or "").removeprefix("www.")
+        if host == "youtu.be" or host in YOUTUBE_HOSTS:
+            return classifyYoutube(host, url.path, parse_qs(url.query))
+        if host in SPOTIFY_HOSTS:
+            if (pathMatch := SPOTIFY_PATH_PATTERN.match(url.path)) is not None:
+                return LinkInfo(Provider.Spotify, SPOTIFY_MEDIA_TYPES[pathMatch.group(1)], pathMatch.group(2))
+    except ValueError:
+        pass  # a broken url like "http://[::1", or an index= too long to be a number
+    return UNKNOWN
+
+
+def classifyYoutube(host: str, path: str, query: dict[str, list[str]]) -> LinkInfo:
+    videoId = None
+    if host == "youtu.be":
+        videoId = path[1:12]
+    elif path == "/watch":
+        videoId = query.get("v", [None])[0]
+    elif (pathMatch := YOUTUBE_PATH_PATTERN.match(path)) is not None:
+        videoId = pathMatch.group(1)
+    elif path == "/attribution_link" and "u" in query:
+        return classifyRequest("https://youtube.com" + unquote(query["u"][0]))
+    elif path == "/oembed" and "url" in query:
+        return classifyRequest(unquote(query["url"][0]))
+
+    if videoId is not None and YOUTUBE_ID_PATTERN.match(videoId):
+        return LinkInfo(Provider.Youtube, MediaType.Video, videoId)
+    playlistId = query.get("list", [None])[0]
+    if playlistId is not None and path in ("/playlist", "/watch"):
+        index = query.get("index", [""])[0]
+        return LinkInfo(Provider.Youtube, MediaType.Playlist, playlistId, int(index) if index.isdigit() else None)
+    return UNKNOWN
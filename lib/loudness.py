@@ -0,0 +1,132 @@
+import json
+import math
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+class LoudnessStore:
+    # Integrated loudness of each track, measured once with ffmpeg's loudnorm filter in analysis mode and kept by
+    # youtube video id. Playback only turns it into a constant gain for its own ffmpeg filter chain, so nothing is
+    # done per packet in python. Tracks are measured in the background the first time they play, one at a time.
+    # The gains of the last MAX_CACHED_GAINS measured tracks are kept in memory, so playing or seeking in them
+    # again doesn't query sqlite from the event loop.
+    MAX_GAIN = 10.0  # dB, quiet tracks aren't pushed up further than this
+    MIN_GAIN = -20.0
+    TRUE_PEAK_LIMIT = -1.0  # dBTP, the gain never pushes a track's peak above this
+    MAX_CACHED_GAINS = 4096
+
+    def __init__(self, path: str, ffmpegExePath: str, targetLufs: float = -14.0, analysisSeconds: float = 300,
+                 analysisTimeout: float = 5 * 60):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS loudness ("
+                "video_id TEXT PRIMARY KEY, integrated REAL NOT NULL, true_peak REAL NOT NULL, "
+                "measured_at REAL NOT NULL)"
+            )
+        self.ffmpegExePath = ffmpegExePath
+        self.targetLufs = targetLufs
+        self.analysisSeconds = analysisSeconds  # only the start of long tracks is measured
+        self.analysisTimeout = analysisTimeout
+        self.analysisPool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="loudness")
+        self.pending: set[str] = set()
+        self.gains: OrderedDict[str, float] = OrderedDict()  # video id -> gain, least recently used first
+        self.measured = 0
+        self.failures = 0
+
+    def getMeasurement(self, videoId: Optional[str]) -> Optional[tuple[float, float]]:
+        if videoId is None:
+            return None
+        with self.lock:
+            return self.connection.execute(
+                "SELECT integrated, true_peak FROM loudness WHERE video_id = ?", (videoId,)
+            ).fetchone()
+
+    def getGain(self, videoId: Optional[str]) -> Optional[float]:
+        # dB bringing the track to the target loudness, None while it wasn't measured
+        if videoId is None:
+            return None
+        with self.lock:
+            gain = self.gains.get(videoId, None)
+            if gain is not None:
+                self.gains.move_to_end(videoId)
+                return gain
+        measurement = self.getMeasurement(videoId)
+        if measurement is None:
+            return None
+        integrated, truePeak = measurement
+        gain = min(self.targetLufs - integrated, self.TRUE_PEAK_LIMIT - truePeak)
+        gain = max(self.MIN_GAIN, min(self.MAX_GAIN, gain))
+        with self.lock:
+            self.gains[videoId] = gain
+            if len(self.gains) > self.MAX_CACHED_GAINS:
+                self.gains.popitem(last=False)
+        return gain
+
+    def putMeasurement(self, videoId: str, integrated: float, truePeak: float):
+        with self.lock, self.connection:
+            self.gains.pop(videoId, None)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?)", (videoId, integrated, truePeak, time.time())
+            )
+
+    def schedule(self, stream: dict):
+        # measures the stream in the background unless it already was
+        videoId = stream.get("id", None)
+        if videoId is None:
+            return
+        with self.lock:
+            if videoId in self.pending:
+                return
+            if videoId in self.gains:
+                return
+            self.pending.add(videoId)
+        if self.getMeasurement(videoId) is not None:
+            with self.lock:
+                self.pending.discard(videoId)
+            return
+        self.analysisPool.submit(self.analyze, videoId, stream["url"], stream.get("local", False))
+
+    def analyze(self, videoId: str, url: str, local: bool):
+        try:
+            result = subprocess.run([
+                self.ffmpegExePath, "-hide_banner", "-nostats",
+                *([] if local else ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5"]),
+                "-t", str(self.analysisSeconds), "-i", url,
+                "-vn", "-af", "loudnorm=print_format=json", "-f", "null", "-"
+            ], capture_output=True, text=True, timeout=self.analysisTimeout, stdin=subprocess.DEVNULL)
+            integrated, truePeak = self.parseLoudnorm(result.stderr)
+            if not math.isfinite(integrated) or not math.isfinite(truePeak):
+                raise ValueError("silent track")  # nothing sensible to normalize to
+            self.putMeasurement(videoId, integrated, truePeak)
+            self.measured += 1
+        except (OSError, subprocess.SubprocessError, ValueError, KeyError, sqlite3.Error):
+            self.failures += 1
+        finally:
+            with self.lock:
+                self.pending.discard(videoId)
+
+    @staticmethod
+    def parseLoudnorm(output: str) -> tuple[float, float]:
+        # loudnorm prints its measurements as the last json object of ffmpeg's log
+        start = output.rindex("{")
+        measurements = json.loads(output[start:output.index("}", start) + 1])
+        return float(measurements["input_i"]), float(measurements["input_tp"])
+
+    def getStats(self) -> dict:
+        return {"measured": self.measured, "failures": self.failures, "pending": len(self.pending)}
+
+    def shutdown(self):
+        self.analysisPool.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+
+class SpotifyMatch(NamedTuple):
+    spotifyId: str
+    youtubeId: str
+    confidence: float  # 1.0 when the durations are identical, down to 0.0
+    durationDelta: int  # in seconds
+    matchedAt: float
+
+
+class SpotifyMatchStore:
+    # Remembers which youtube video was picked for a spotify track, so the search runs once per track instead
+    # of once per play. Matches that turn out wrong are invalidated and their video is never picked again.
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS spotify_matches ("
+                "spotify_id TEXT PRIMARY KEY, youtube_id TEXT NOT NULL, confidence REAL NOT NULL, "
+                "duration_delta INTEGER NOT NULL, matched_at REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS rejected_matches ("
+                "spotify_id TEXT NOT NULL, youtube_id TEXT NOT NULL, PRIMARY KEY (spotify_id, youtube_id))"
+            )
+
+    @staticmethod
+    def calculateConfidence(spotifyDuration: int, youtubeDuration: Optional[int]) -> tuple[float, int]:
+        if youtubeDuration is None:
+            return 0.0, spotifyDuration
+        durationDelta = abs(round(youtubeDuration) - spotifyDuration)
+        return max(0.0, 1.0 - durationDelta / max(spotifyDuration, 1)), durationDelta
+
+    def getMatch(self, spotifyId: str) -> Optional[SpotifyMatch]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT spotify_id, youtube_id, confidence, duration_delta, matched_at "
+                "FROM spotify_matches WHERE spotify_id = ?", (spotifyId,)
+            ).fetchone()
+        return None if row is None else SpotifyMatch(*row)
+
+    def putMatch(self, spotifyId: str, youtubeId: str, confidence: float, durationDelta: int) -> SpotifyMatch:
+        match = SpotifyMatch(spotifyId, youtubeId, confidence, durationDelta, time.time())
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO spotify_matches VALUES (?, ?, ?, ?, ?)", match
+            )
+        return match
+
+    def invalidate(self, spotifyId: str) -> Optional[SpotifyMatch]:
+        match = self.getMatch(spotifyId)
+        if match is None:
+            return None
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM spotify_matches WHERE spotify_id = ?", (spotifyId,))
+            self.connection.execute(
+                "INSERT OR IGNORE INTO rejected_matches VALUES (?, ?)", (spotifyId, match.youtubeId)
+            )
+        return match
+
+    def getRejected(self, spotifyId: str) -> set[str]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT youtube_id FROM rejected_matches WHERE spotify_id = ?", (spotifyId,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
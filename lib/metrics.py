@@ -0,0 +1,152 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+
+class Histogram:
+    # Fixed bucket histogram, cheap enough to observe on every command. Values are in seconds.
+    # Values observed are also observed by `parent`, which is how per-guild histograms feed the global ones.
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, parent: Optional["Histogram"] = None):
+        self.buckets = buckets
+        self.parent = parent
+        self.bucketCounts = [0] * (len(buckets) + 1)  # the last one counts everything above the biggest bucket
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            self.bucketCounts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+        if self.parent is not None:
+            self.parent.observe(value)
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-th value, the max when it is past the last bucket
+        if self.count <= 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucketCount in enumerate(self.bucketCounts):
+            seen += bucketCount
+            if seen >= rank and bucketCount > 0:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max
+        }
+
+    def cumulativeCounts(self) -> list[int]:
+        with self.lock:
+            counts = list(self.bucketCounts)
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        return counts
+
+
+class MetricsRegistry:
+    # Named histograms, one global and one per guild, plus gauges read when the metrics are shown.
+    # Per guild histograms observe into the global one of the same name, so each value is only observed once.
+    PREFIX = "viktor"
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self.guildHistograms: dict[int, dict[str, Histogram]] = {}
+        self.gauges: dict[str, Callable[[], float]] = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str, guildId: Optional[int] = None,
+                  buckets: tuple[float, ...] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        with self.lock:
+            parent = self.histograms.get(name, None)
+            if parent is None:
+                parent = self.histograms[name] = Histogram(buckets)
+            if guildId is None:
+                return parent
+            guildHistograms = self.guildHistograms.setdefault(guildId, {})
+            histogram = guildHistograms.get(name, None)
+            if histogram is None:
+                histogram = guildHistograms[name] = Histogram(parent.buckets, parent)
+            return histogram
+
+    @contextmanager
+    def span(self, name: str, guildId: Optional[int] = None) -> Iterator[None]:
+        # times the block, failed attempts included
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, guildId).observe(time.perf_counter() - start)
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        self.gauges[name] = read
+
+    def dropGuild(self, guildId: int):
+        with self.lock:
+            self.guildHistograms.pop(guildId, None)
+
+    def getSummaries(self, guildId: Optional[int] = None) -> dict[str, dict]:
+        with self.lock:
+            histograms = dict(self.histograms if guildId is None else self.guildHistograms.get(guildId, {}))
+        return {name: histogram.summary() for name, histogram in sorted(histograms.items())}
+
+    def readGauges(self) -> dict[str, float]:
+        values = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                values[name] = float(read())
+            except Exception:
+                continue  # a gauge that can't be read right now is left out
+        return values
+
+    def toPrometheus(self) -> str:
+        # text exposition format, version 0.0.4
+        lines = []
+        with self.lock:
+            histograms = list(self.histograms.items())
+            guildHistograms = [
+                (guildId, name, histogram)
+                for guildId, named in self.guildHistograms.items() for name, histogram in named.items()
+            ]
+        for name, histogram in sorted(histograms):
+            metric = f"{self.PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            lines += self.formatHistogram(metric, histogram, "")
+        lastMetric = None
+        for guildId, name, histogram in sorted(guildHistograms, key=lambda item: (item[1], item[0])):
+            metric = f"{self.PREFIX}_guild_{name}_seconds"
+            if metric != lastMetric:
+                lines.append(f"# TYPE {metric} histogram")
+                lastMetric = metric
+            lines += self.formatHistogram(metric, histogram, f'guild="{guildId}"')
+        for name, value in sorted(self.readGauges().items()):
+            lines.append(f"# TYPE {self.PREFIX}_{name} gauge")
+            lines.append(f"{self.PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def formatHistogram(metric: str, histogram: Histogram, labels: str) -> list[str]:
+        counts = histogram.cumulativeCounts()
+        bucketLabels = labels + "," if labels else ""
+        labels = "{" + labels + "}" if labels else ""
+        lines = [
+            f'{metric}_bucket{{{bucketLabels}le="{bound}"}} {count}'
+            for bound, count in zip(histogram.buckets + ("+Inf",), counts)
+        ]
+        lines.append(f"{metric}_sum{labels} {histogram.sum}")
+        lines.append(f"{metric}_count{labels} {histogram.count}")
+        return lines
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Optional
+
+from lib.metrics import MetricsRegistry
+
+
+class PrometheusEndpoint:
+    # Serves the registry as prometheus text on GET /metrics. Meant to be bound to localhost for a local scraper,
+    # so it only speaks enough http/1.0 for that and answers everything else with a 404.
+    READ_TIMEOUT = 5  # seconds
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if self.server is None:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            requestLine = await asyncio.wait_for(reader.readline(), self.READ_TIMEOUT)
+            while (await asyncio.wait_for(reader.readline(), self.READ_TIMEOUT)) not in (b"\r\n", b"\n", b""):
+                pass  # headers aren't needed
+            parts = requestLine.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.registry.toPrometheus().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional
+
+
+class QueueJournal:
+    # Append-only log of one guild's queue mutations next to a snapshot of its whole state, so the queue survives
+    # a restart without resolving anything again: nodes are written with the metadata they were queued with.
+    # Each record is a compact json list on its own line, a line cut short by a crash is ignored when loading.
+    # After `snapshotEvery` records (or a shuffle) the state is snapshotted and the log starts over. Used as the
+    # TrackQueue's observer, the rest (now playing, loop mode, channels) is told by the guild context.
+    # With a `writer` (a single thread executor, shared by the guilds) the files are only touched on its thread:
+    # records are encoded right away and the ones written meanwhile are appended and flushed together, and a
+    # snapshot is taken right away but dumped and fsynced there, so a big queue doesn't stall the caller. Its jobs
+    # run in order, so a snapshot never lands before records written ahead of it. Without one it all happens inline.
+    EXTEND, GET, SKIP_TO, REMOVE, MOVE, CLEAR, PLAYING, LOOP_MODE, CHANNELS, ALIVE, VOLUME = "egkrmcplvto"
+
+    def __init__(self, directory: str, guildId: int, encode: Callable[[Any], list],
+                 snapshotSource: Callable[[], dict], snapshotEvery: int = 500, writer: Optional[Executor] = None):
+        self.journalPath = os.path.join(directory, f"{guildId}.journal")
+        self.snapshotPath = os.path.join(directory, f"{guildId}.snapshot.json")
+        self.encode = encode
+        self.snapshotSource = snapshotSource  # the whole state in the shape `load` returns, nodes encoded
+        self.snapshotEvery = snapshotEvery
+        self.writer = writer
+        self.records = 0
+        self.pending: list[str] = []  # lines waiting for the writer
+        self.channels: Optional[tuple[Optional[int], Optional[int]]] = None
+        self.file = None
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, func: Callable, *args):
+        if self.writer is None:
+            func(*args)
+        else:
+            self.writer.submit(self.logFailure, func, *args)
+
+    @staticmethod
+    def logFailure(func: Callable, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            logging.getLogger("viktor.music.journal").error(f"queue journal write failed: {e!r}")
+
+    def write(self, *record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.pending.append(line)
+            self.records += 1
+            if self.records >= self.snapshotEvery:
+                self.snapshot()
+            elif len(self.pending) == 1:
+                self.run(self.append, self.pending)  # later lines join this batch until the writer takes it
+
+    def append(self, batch: list[str]):
+        with self.lock:
+            lines = "".join(batch)
+            batch.clear()
+        if not lines:
+            return
+        if self.file is None:
+            self.file = open(self.journalPath, "a", encoding="utf8")
+        self.file.write(lines)
+        self.file.flush()
+
+    def snapshot(self):
+        with self.lock:
+            state = self.snapshotSource()
+            self.pending.clear()  # the snapshot has them, the batch the writer still holds is left empty
+            self.pending = []
+            self.records = 0
+        self.run(self.save, state)
+
+    def save(self, state: dict):
+        self.closeFile()
+        if not state["queue"] and state["playing"] is None:
+            self.remove()  # nothing to restore
+            return
+        state["savedAt"] = time.time()
+        temporaryPath = self.snapshotPath + ".tmp"
+        with open(temporaryPath, "w", encoding="utf8") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaryPath, self.snapshotPath)
+        open(self.journalPath, "w").close()
+
+    def remove(self):
+        for path in (self.snapshotPath, self.journalPath):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self.run(self.closeFile)
+
+    def closeFile(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    # TrackQueue observer
+
+    def onExtend(self, items: list):
+        self.write(self.EXTEND, [self.encode(item) for item in items])
+
+    def onGet(self):
+        self.write(self.GET)
+
+    def onSkipTo(self, index: int):
+        self.write(self.SKIP_TO, index)
+
+    def onRemove(self, index: int):
+        self.write(self.REMOVE, index)
+
+    def onMove(self, source: int, destination: int):
+        self.write(self.MOVE, source, destination)
+
+    def onShuffle(self):
+        self.snapshot()  # the new order is as big as the queue anyway
+
+    def onClear(self):
+        self.write(self.CLEAR)
+
+    # guild context
+
+    def setPlaying(self, node, startedAt: Optional[float]):
+        self.write(self.PLAYING, None if node is None else self.encode(node), startedAt)
+
+    def setLoopMode(self, loopMode: int):
+        self.write(self.LOOP_MODE, loopMode)
+
+    def setVolume(self, volume: int):
+        self.write(self.VOLUME, volume)
+
+    def setChannels(self, voiceChannelId: Optional[int], replyChannelId: Optional[int]):
+        if self.channels != (voiceChannelId, replyChannelId):
+            self.channels = (voiceChannelId, replyChannelId)
+            self.write(self.CHANNELS, voiceChannelId, replyChannelId)
+
+    def markAlive(self):
+        # written now and then while playing, the playing position is estimated from the last one after a crash
+        self.write(self.ALIVE, round(time.time(), 1))
+
+    @classmethod
+    def load(cls, directory: str, guildId: int) -> Optional[dict]:
+        # the snapshot with the journal replayed on top, nodes still encoded. None when there is nothing to restore
+        snapshotPath = os.path.join(directory, f"{guildId}.snapshot.json")
+        journalPath = os.path.join(directory, f"{guildId}.journal")
+        state = {"queue": [], "playing": None, "startedAt": None, "loopMode": 0, "voiceChannelId": None,
+                 "replyChannelId": None, "savedAt": None}
+        try:
+            with open(snapshotPath, "r", encoding="utf8") as f:
+                state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            pass  # a snapshot is only ever replaced whole, but don't refuse to start over a broken file
+        queue = deque(state["queue"])
+        lastAliveAt = state["savedAt"]
+        try:
+            with open(journalPath, "r", encoding="utf8") as f:
+                for line in f:
+                    try:
+                        op, *args = json.loads(line)
+                        if op == cls.EXTEND:
+                            queue.extend(args[0])
+                        elif op == cls.GET:
+                            queue.popleft()
+                        elif op == cls.SKIP_TO:
+                            for _ in range(args[0]):
+                                queue.popleft()
+                        elif op == cls.REMOVE:
+                            del queue[args[0]]
+                        elif op == cls.MOVE:
+                            node = queue[args[0]]
+                            del queue[args[0]]
+                            queue.insert(args[1], node)
+                        elif op == cls.CLEAR:
+                            queue.clear()
+                        elif op == cls.PLAYING:
+                            state["playing"], state["startedAt"] = args
+                            lastAliveAt = args[1] or lastAliveAt
+                        elif op == cls.LOOP_MODE:
+                            state["loopMode"] = args[0]
+                        elif op == cls.CHANNELS:
+                            state["voiceChannelId"], state["replyChannelId"] = args
+                        elif op == cls.ALIVE:
+                            lastAliveAt = args[0]
+                        elif op == cls.VOLUME:
+                            state["volume"] = args[0]
+                    except (ValueError, IndexError, TypeError):
+                        break  # cut short by a crash, nothing after it was written
+        except FileNotFoundError:
+            pass
+        state["queue"] = list(queue)
+        state["lastAliveAt"] = lastAliveAt
+        if not state["queue"] and state["playing"] is None:
+            return None
+        return state
+
+    @staticmethod
+    def setAside(directory: str, guildId: int):
+        # renames the files of a guild that couldn't be restored, so they are neither loaded nor appended to again
+        for name in (f"{guildId}.journal", f"{guildId}.snapshot.json"):
+            path = os.path.join(directory, name)
+            try:
+                os.replace(path, path + ".broken")
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def listGuilds(directory: str) -> list[int]:
+        if not os.path.isdir(directory):
+            return []
+        return sorted({
+            int(name.split(".")[0]) for name in os.listdir(directory)
+            if name.split(".")[0].isdigit() and name.endswith((".journal", ".snapshot.json"))
+        })
+
+
+class DisabledQueueJournal:
+    # stands in for QueueJournal when persistence is turned off
+    def onExtend(self, items: list):
+        pass
+
+    def onGet(self):
+        pass
+
+    def onSkipTo(self, index: int):
+        pass
+
+    def onRemove(self, index: int):
+        pass
+
+    def onMove(self, source: int, destination: int):
+        pass
+
+    def onShuffle(self):
+        pass
+
+    def onClear(self):
+        pass
+
+    def setPlaying(self, node, startedAt: Optional[float]):
+        pass
+
+    def setLoopMode(self, loopMode: int):
+        pass
+
+    def setVolume(self, volume: int):
+        pass
+
+    def setChannels(self, voiceChannelId: Optional[int], replyChannelId: Optional[int]):
+        pass
+
+    def markAlive(self):
+        pass
+
+    def snapshot(self):
+        pass
+
+    def close(self):
+        pass
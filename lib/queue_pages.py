@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from lib.track_queue import TrackQueue
+
+
+class QueuePageRenderer:
+    # Renders pages of a TrackQueue for /queue. Each node's row is formatted once and kept in a small lru, and
+    # each rendered page remembers the queue version it was made from. A page is reused as long as the queue
+    # didn't change at or before its last row since then, so appending songs leaves the pages before them alone,
+    # and pages shifted by a song finishing are put back together from the cached rows.
+    MAX_ROWS = 4096
+    MAX_PAGES = 256
+
+    def __init__(self, queue: TrackQueue, formatRow: Callable[[object], str], pageSize: int = 15):
+        self.queue = queue
+        self.formatRow = formatRow
+        self.pageSize = pageSize
+        self.rows: OrderedDict[object, str] = OrderedDict()  # node -> its row without the position
+        self.pages: OrderedDict[int, tuple[int, str]] = OrderedDict()  # page -> (queue version, rendered rows)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def pageCount(self) -> int:
+        return max(1, -(-len(self.queue) // self.pageSize))
+
+    def clampPage(self, page: int) -> int:
+        return min(max(0, page), self.pageCount() - 1)
+
+    def getRow(self, node) -> str:
+        row = self.rows.get(node, None)
+        if row is None:
+            row = self.rows[node] = self.formatRow(node)
+            if len(self.rows) > self.MAX_ROWS:
+                self.rows.popitem(last=False)
+        else:
+            self.rows.move_to_end(node)
+        return row
+
+    def render(self, page: int) -> tuple[int, str]:
+        # returns the page actually rendered, clamped to the queue, and its rows
+        with self.queue.lock, self.lock:
+            page = self.clampPage(page)
+            version = self.queue.version
+            start = page * self.pageSize
+            cached = self.pages.get(page, None)
+            if cached is not None and self.queue.firstChangedIndexSince(cached[0]) >= start + self.pageSize:
+                self.hits += 1
+                self.pages[page] = (version, cached[1])
+                self.pages.move_to_end(page)
+                return page, cached[1]
+
+            self.misses += 1
+            text = "\n".join(
+                f"``[{start + i + 1:02}]``{self.getRow(node)}"
+                for i, node in enumerate(self.queue.slice(start, start + self.pageSize))
+            )
+            self.pages[page] = (version, text)
+            self.pages.move_to_end(page)
+            if len(self.pages) > self.MAX_PAGES:
+                self.pages.popitem(last=False)
+            return page, text
+
+    def clear(self):
+        with self.lock:
+            self.rows.clear()
+            self.pages.clear()
+
+    def getStats(self) -> dict:
+        return {"rows": len(self.rows), "pages": len(self.pages), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,194 @@
+import random
+import sys
+import threading
+from collections import deque
+from typing import Generic, Iterator, Optional, Protocol, TypeVar
+
+
+class Track(Protocol):
+    def getDuration(self) -> int:
+        ...
+
+
+T = TypeVar("T", bound=Track)
+
+
+class QueueObserver(Protocol[T]):
+    # told about every mutation after it was applied, while the queue's lock is still held
+    def onExtend(self, items: list[T]):
+        ...
+
+    def onGet(self):
+        ...
+
+    def onSkipTo(self, index: int):
+        ...
+
+    def onRemove(self, index: int):
+        ...
+
+    def onMove(self, source: int, destination: int):
+        ...
+
+    def onShuffle(self):
+        ...
+
+    def onClear(self):
+        ...
+
+
+class TrackQueue(Generic[T]):
+    # Queue of songs that, unlike queue.Queue, can be indexed and sliced without copying it.
+    # Items live in a list whose first `head` slots were already consumed, so popping the front is O(1)
+    # and the list is compacted only once the dead prefix gets big. The total duration is kept up to date on
+    # every mutation and `version` is bumped on each one, so views of the queue know when they are stale.
+    # The first index touched by each of the last mutations is logged so those views can tell what part went stale.
+    COMPACT_THRESHOLD = 1024
+    CHANGE_LOG_SIZE = 256
+
+    def __init__(self):
+        self.items: list[T] = []
+        self.head = 0
+        self.totalDuration = 0  # in seconds
+        self.version = 0
+        self.changes: deque[tuple[int, int]] = deque(maxlen=self.CHANGE_LOG_SIZE)  # (version, first index changed)
+        self.lock = threading.RLock()
+        self.observer: Optional[QueueObserver[T]] = None
+
+    def __len__(self):
+        return len(self.items) - self.head
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self.slice(0, len(self)))
+
+    def __getitem__(self, index: int) -> T:
+        with self.lock:
+            return self.items[self.absoluteIndex(index)]
+
+    def empty(self) -> bool:
+        return len(self) <= 0
+
+    def absoluteIndex(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("track queue index out of range")
+        return self.head + index
+
+    def mutated(self, firstIndex: int = 0):
+        self.version += 1
+        self.changes.append((self.version, firstIndex))
+
+    def firstChangedIndexSince(self, version: int) -> int:
+        # lowest index changed by the mutations after `version`, 0 when they are older than the log
+        with self.lock:
+            if version >= self.version:
+                return sys.maxsize
+            if not self.changes or self.changes[0][0] > version + 1:
+                return 0
+            firstIndex = sys.maxsize
+            for changeVersion, index in reversed(self.changes):
+                if changeVersion <= version:
+                    break
+                firstIndex = min(firstIndex, index)
+            return firstIndex
+
+    def put(self, item: T):
+        with self.lock:
+            self.items.append(item)
+            self.totalDuration += item.getDuration()
+            self.mutated(len(self) - 1)
+            if self.observer is not None:
+                self.observer.onExtend([item])
+
+    def extend(self, items: list[T]):
+        with self.lock:
+            firstIndex = len(self)
+            self.items.extend(items)
+            self.totalDuration += sum(item.getDuration() for item in items)
+            self.mutated(firstIndex)
+            if self.observer is not None:
+                self.observer.onExtend(items)
+
+    def get(self) -> T:
+        with self.lock:
+            if self.empty():
+                raise IndexError("get from an empty track queue")
+            item = self.items[self.head]
+            self.items[self.head] = None
+            self.head += 1
+            self.totalDuration -= item.getDuration()
+            self.compact()
+            self.mutated()
+            if self.observer is not None:
+                self.observer.onGet()
+            return item
+
+    def peek(self, count: int) -> list[T]:
+        return self.slice(0, count)
+
+    def slice(self, start: int, stop: int) -> list[T]:
+        with self.lock:
+            start = max(0, start)
+            stop = min(len(self), stop)
+            return self.items[self.head + start: self.head + stop]
+
+    def skipTo(self, index: int) -> int:
+        # drops every item before `index`, returns how many were dropped
+        with self.lock:
+            index = min(max(0, index), len(self))
+            if index <= 0:
+                return 0
+            dropped = self.items[self.head: self.head + index]
+            self.totalDuration -= sum(item.getDuration() for item in dropped)
+            self.items[self.head: self.head + index] = [None] * index
+            self.head += index
+            self.compact()
+            self.mutated()
+            if self.observer is not None:
+                self.observer.onSkipTo(index)
+            return index
+
+    def remove(self, index: int) -> T:
+        with self.lock:
+            index = self.absoluteIndex(index) - self.head
+            item = self.items.pop(self.head + index)
+            self.totalDuration -= item.getDuration()
+            self.mutated(index)
+            if self.observer is not None:
+                self.observer.onRemove(index)
+            return item
+
+    def move(self, source: int, destination: int):
+        with self.lock:
+            sourceIndex = self.absoluteIndex(source) - self.head
+            item = self.items.pop(self.head + sourceIndex)
+            destination = min(max(0, destination), len(self))
+            self.items.insert(self.head + destination, item)
+            self.mutated(min(sourceIndex, destination))
+            if self.observer is not None:
+                self.observer.onMove(sourceIndex, destination)
+
+    def shuffle(self):
+        with self.lock:
+            remaining = self.items[self.head:]
+            random.shuffle(remaining)
+            self.items = remaining
+            self.head = 0
+            self.mutated()
+            if self.observer is not None:
+                self.observer.onShuffle()
+
+    def clear(self):
+        with self.lock:
+            self.items = []
+            self.head = 0
+            self.totalDuration = 0
+            self.mutated()
+            if self.observer is not None:
+                self.observer.onClear()
+
+    def compact(self):
+        if self.head >= self.COMPACT_THRESHOLD and self.head * 2 >= len(self.items):
+            del self.items[:self.head]
+            self.head = 0